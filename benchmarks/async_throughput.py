@@ -0,0 +1,80 @@
+"""Throughput of `AsyncRlsSession` on asyncpg against `RlsSession` run in a
+threadpool, the way sync FastAPI endpoints are served.
+
+Run with `python -m benchmarks.async_throughput` from the repository root.
+"""
+
+import asyncio
+import concurrent.futures
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from rls.async_rls_session import AsyncRlsSession
+from rls.rls_session import RlsSession
+from test import database, models
+
+REQUESTS = 5000
+CONCURRENCY = 40
+POOL_SIZE = 10
+
+
+def sync_request(engine, account_id: int) -> None:
+    context = models.SampleRlsContext(account_id=account_id)
+    with RlsSession(context=context, bind=engine) as session:
+        session.execute(select(models.Item.title)).all()
+
+
+async def async_request(engine, account_id: int) -> None:
+    context = models.SampleRlsContext(account_id=account_id)
+    async with AsyncRlsSession(context=context, bind=engine) as session:
+        (await session.execute(select(models.Item.title))).all()
+
+
+async def run_sync_in_threadpool(url) -> float:
+    engine = create_engine(url, pool_size=POOL_SIZE, max_overflow=0)
+    loop = asyncio.get_running_loop()
+    with concurrent.futures.ThreadPoolExecutor(CONCURRENCY) as executor:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(executor, sync_request, engine, i % 2 + 1)
+                for i in range(REQUESTS)
+            )
+        )
+        elapsed = time.perf_counter() - start
+    engine.dispose()
+    return REQUESTS / elapsed
+
+
+async def run_async(url) -> float:
+    engine = create_async_engine(
+        url.set(drivername="postgresql+asyncpg"), pool_size=POOL_SIZE, max_overflow=0
+    )
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def limited_request(account_id: int) -> None:
+        async with semaphore:
+            await async_request(engine, account_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited_request(i % 2 + 1) for i in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return REQUESTS / elapsed
+
+
+async def main():
+    instance = database.test_postgres_instance()
+    url = instance.non_superadmin_engine.url
+
+    print(f"{'session':<28}{'requests/s':>12}")
+    throughput = await run_sync_in_threadpool(url)
+    print(f"{'RlsSession (threadpool)':<28}{throughput:>12.0f}")
+    throughput = await run_async(url)
+    print(f"{'AsyncRlsSession (asyncpg)':<28}{throughput:>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
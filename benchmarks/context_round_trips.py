@@ -0,0 +1,67 @@
+"""Round trips and latency per query for each `ContextMode`. Each query runs in
+its own transaction, like a request would, since the context is applied once
+per transaction. The round trips count the statements, not BEGIN and COMMIT.
+
+Run with `python -m benchmarks.context_round_trips` from the repository root.
+"""
+
+import time
+
+import pydantic
+from sqlalchemy import event, select
+
+from rls.rls_session import ContextMode, RlsSession
+from test import database, models
+
+QUERIES = 2000
+
+
+class WideRlsContext(pydantic.BaseModel):
+    account_id: int
+    provider_id: int
+    region_id: int
+    role: str
+    locale: str
+
+
+def run(engine, context_mode: ContextMode) -> tuple[float, float]:
+    """Returns the round trips and the latency in milliseconds per query."""
+    context = WideRlsContext(
+        account_id=1, provider_id=2, region_id=3, role="admin", locale="en"
+    )
+    round_trips = 0
+
+    def count_round_trip(*args):
+        nonlocal round_trips
+        round_trips += 1
+
+    event.listen(engine, "before_cursor_execute", count_round_trip)
+    try:
+        with RlsSession(
+            context=context, bind=engine, context_mode=context_mode
+        ) as session:
+            start = time.perf_counter()
+            for _ in range(QUERIES):
+                with session.begin():
+                    session.execute(select(models.User.username)).all()
+            elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, "before_cursor_execute", count_round_trip)
+
+    return round_trips / QUERIES, elapsed * 1000 / QUERIES
+
+
+def main():
+    instance = database.test_postgres_instance()
+    engine = instance.non_superadmin_engine
+    # Warm up the pool and the dialect initialization
+    run(engine, ContextMode.set)
+
+    print(f"{'mode':<18}{'round trips/query':>20}{'ms/query':>12}")
+    for context_mode in ContextMode:
+        round_trips, latency = run(engine, context_mode)
+        print(f"{context_mode.name:<18}{round_trips:>20.2f}{latency:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Peak memory of exporting a large tenant with `RlsSession.stream_batches`
+against fetching every row with `fetchall()`.
+
+Run with `python -m benchmarks.export_memory` from the repository root.
+"""
+
+import time
+import tracemalloc
+
+from sqlalchemy import insert, select
+
+from rls.rls_session import RlsSession
+from test import database, models
+
+ROWS = 200_000
+BATCH_SIZE = 1000
+
+
+def fetch_all(session: RlsSession) -> int:
+    rows = session.execute(select(models.Item.title, models.Item.description))
+    return len(rows.fetchall())
+
+
+def stream(session: RlsSession) -> int:
+    return sum(
+        len(rows)
+        for rows in session.stream_batches(
+            select(models.Item.title, models.Item.description), BATCH_SIZE
+        )
+    )
+
+
+def run(engine, export) -> tuple[int, float, float]:
+    """Returns the rows exported, the peak memory in MiB and the seconds."""
+    context = models.SampleRlsContext(account_id=1)
+    with RlsSession(context=context, bind=engine) as session:
+        tracemalloc.start()
+        start = time.perf_counter()
+        count = export(session)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return count, peak / 2**20, elapsed
+
+
+def main():
+    instance = database.test_postgres_instance()
+    with instance.admin_engine.begin() as connection:
+        connection.execute(
+            insert(models.Item),
+            [
+                {
+                    "title": f"Exported item {i}",
+                    "description": f"Description of exported item {i}",
+                    "owner_id": 1,
+                }
+                for i in range(ROWS)
+            ],
+        )
+
+    engine = instance.non_superadmin_engine
+    print(f"{'export':<16}{'rows':>10}{'peak MiB':>12}{'seconds':>10}")
+    for export in (fetch_all, stream):
+        count, peak, elapsed = run(engine, export)
+        print(f"{export.__name__:<16}{count:>10}{peak:>12.1f}{elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
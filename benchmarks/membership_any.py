@@ -0,0 +1,88 @@
+"""Latency of a policy matching a list of accounts with `= ANY(<array>)`, for
+users belonging to 1, 100 and 10,000 accounts, over a million rows table.
+
+The policy is compiled for the bypass role strategy, without the per-row
+bypass check, so the planner can use the index on `account_id`.
+
+Run with `python -m benchmarks.membership_any` from the repository root.
+"""
+
+import time
+from typing import List
+
+import pydantic
+from sqlalchemy import ARRAY, Integer, column, text
+
+from rls.rls_session import RlsSession
+from rls.schemas import Command, ConditionArg, Permissive
+from test import database
+
+ROWS = 1_000_000
+ACCOUNTS = 100_000
+QUERIES = 20
+MEMBERSHIPS = (1, 100, 10_000)
+
+
+class MembershipContext(pydantic.BaseModel):
+    account_ids: List[int]
+
+
+def create_policy(admin_engine) -> None:
+    policy = Permissive(
+        condition_args=[
+            ConditionArg(comparator_name="account_ids", type=ARRAY(Integer))
+        ],
+        cmd=Command.select,
+        custom_expr=lambda x: column("account_id") == x,
+        custom_policy_name="member",
+    )
+    [stmt] = policy.get_sql_policies(
+        table_name="bench_memberships", bypass_role="bench_bypass"
+    )
+    with admin_engine.begin() as connection:
+        connection.execute(stmt)
+
+
+def run(engine, memberships: int) -> tuple[float, int, str]:
+    """Returns the milliseconds per query, the rows counted and the scan."""
+    # Spread the accounts over the table
+    step = ACCOUNTS // memberships
+    context = MembershipContext(account_ids=list(range(0, ACCOUNTS, step)))
+    query = text("SELECT count(*) FROM bench_memberships")
+    with RlsSession(context=context, bind=engine) as session:
+        plan = session.execute(text(f"EXPLAIN {query}")).scalars().all()
+        scan = next(line for line in plan if "Scan" in line)
+        scan = scan.split("->")[-1].split("  (")[0]
+        count = session.execute(query).scalar()
+        start = time.perf_counter()
+        for _ in range(QUERIES):
+            session.execute(query).scalar()
+        return (time.perf_counter() - start) * 1000 / QUERIES, count, scan.strip()
+
+
+def main():
+    instance = database.test_postgres_instance()
+    with instance.admin_engine.begin() as connection:
+        connection.execute(
+            text(f"""
+            CREATE ROLE bench_bypass NOLOGIN;
+            CREATE TABLE bench_memberships AS
+                SELECT i AS id, i % {ACCOUNTS} AS account_id
+                FROM generate_series(1, {ROWS}) i;
+            CREATE INDEX ON bench_memberships (account_id);
+            ALTER TABLE bench_memberships ENABLE ROW LEVEL SECURITY;
+            GRANT SELECT ON bench_memberships TO test_user;
+            ANALYZE bench_memberships;
+            """)
+        )
+    create_policy(instance.admin_engine)
+
+    engine = instance.non_superadmin_engine
+    print(f"{'memberships':<14}{'rows':>8}{'ms/query':>10}  plan")
+    for memberships in MEMBERSHIPS:
+        latency, count, scan = run(engine, memberships)
+        print(f"{memberships:<14}{count:>8}{latency:>10.2f}  {scan}")
+
+
+if __name__ == "__main__":
+    main()
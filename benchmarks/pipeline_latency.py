@@ -0,0 +1,95 @@
+"""Latency per request with and without the psycopg pipeline, through a local
+proxy delaying every packet to mimic a database in another availability zone.
+
+Run with `python -m benchmarks.pipeline_latency` from the repository root.
+"""
+
+import queue
+import socket
+import threading
+import time
+
+from sqlalchemy import create_engine, select
+
+from rls.rls_session import RlsSession
+from test import database, models
+
+REQUESTS = 500
+# One way delay, a round trip costs twice as much
+DELAY = 0.0005
+
+
+def forward(source: socket.socket, destination: socket.socket) -> None:
+    """
+    Sends everything received from `source` to `destination` `DELAY` seconds
+    later. Packets are delayed independently, so several packets in flight
+    cost a single delay like on a real network.
+    """
+    packets: queue.Queue = queue.Queue()
+
+    def send():
+        while (packet := packets.get()) is not None:
+            received_at, data = packet
+            time.sleep(max(0.0, received_at + DELAY - time.perf_counter()))
+            destination.sendall(data)
+        destination.close()
+
+    threading.Thread(target=send, daemon=True).start()
+    try:
+        while data := source.recv(65536):
+            packets.put((time.perf_counter(), data))
+    except OSError:
+        pass
+    finally:
+        packets.put(None)
+
+
+def start_delay_proxy(host: str, port: int) -> int:
+    """Starts a proxy to `host:port` in the background and returns its port."""
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def accept():
+        while True:
+            client, _ = listener.accept()
+            upstream = socket.create_connection((host, port))
+            for source, destination in ((client, upstream), (upstream, client)):
+                source.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                threading.Thread(
+                    target=forward, args=(source, destination), daemon=True
+                ).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def run(engine, pipeline: bool) -> float:
+    """Returns the latency in milliseconds per request."""
+    start = time.perf_counter()
+    for account_id in range(REQUESTS):
+        context = models.SampleRlsContext(account_id=account_id % 2 + 1)
+        with RlsSession(context=context, bind=engine, pipeline=pipeline) as session:
+            session.execute(select(models.User.username)).all()
+            session.commit()
+    return (time.perf_counter() - start) * 1000 / REQUESTS
+
+
+def main():
+    instance = database.test_postgres_instance()
+    url = instance.non_superadmin_engine.url
+    proxy_port = start_delay_proxy(url.host or "127.0.0.1", url.port or 5432)
+    # The pipeline mode needs psycopg 3, whatever the default driver is
+    engine = create_engine(
+        url.set(drivername="postgresql+psycopg", host="127.0.0.1", port=proxy_port)
+    )
+    # Warm up the pool and the dialect initialization
+    run(engine, pipeline=False)
+
+    print(f"round trip: {DELAY * 2000:.1f} ms")
+    print(f"{'pipeline':<12}{'ms/request':>12}")
+    for pipeline in (False, True):
+        print(f"{str(pipeline):<12}{run(engine, pipeline):>12.3f}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
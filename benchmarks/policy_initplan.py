@@ -0,0 +1,82 @@
+"""Cost per scanned row of a policy reading its settings with a bare
+`current_setting(...)` against the default InitPlan wrapped
+`(SELECT current_setting(...))`, over a million rows table.
+
+Run with `python -m benchmarks.policy_initplan` from the repository root.
+"""
+
+import time
+
+from sqlalchemy import Integer, column, text
+
+from rls.rls_session import RlsSession
+from rls.schemas import Command, ConditionArg, Permissive
+from rls.utils import generate_rls_policy
+from test import database, models
+
+ROWS = 1_000_000
+QUERIES = 5
+# The bypass clause as it was compiled before the InitPlan wrapping
+PER_ROW_BYPASS_RLS_EXPR = (
+    "CAST(NULLIF(current_setting('rls.bypass_rls', true), '') AS BOOLEAN) = true"
+)
+
+
+def create_policy(admin_engine, initplan: bool) -> None:
+    policy = Permissive(
+        condition_args=[ConditionArg(comparator_name="account_id", type=Integer)],
+        cmd=Command.select,
+        custom_expr=lambda x: column("owner_id") == x,
+        custom_policy_name="owner",
+        initplan=initplan,
+    )
+    [stmt] = policy.get_sql_policies(table_name="bench_rows")
+    if not initplan:
+        stmt = generate_rls_policy(
+            cmd=Command.select.value,
+            definition=policy.definition,
+            policy_name=policy.policy_names[-1],
+            table_name="bench_rows",
+            expr=f"(({policy.expression}) OR {PER_ROW_BYPASS_RLS_EXPR})",
+        )
+    with admin_engine.begin() as connection:
+        connection.execute(
+            text("DROP POLICY IF EXISTS bench_rows_owner_select_policy_0 ON bench_rows")
+        )
+        connection.execute(stmt)
+
+
+def run(engine) -> float:
+    """Returns the milliseconds per query."""
+    context = models.SampleRlsContext(account_id=1)
+    with RlsSession(context=context, bind=engine) as session:
+        start = time.perf_counter()
+        for _ in range(QUERIES):
+            session.execute(text("SELECT count(*) FROM bench_rows")).scalar()
+        return (time.perf_counter() - start) * 1000 / QUERIES
+
+
+def main():
+    instance = database.test_postgres_instance()
+    with instance.admin_engine.begin() as connection:
+        connection.execute(
+            text(f"""
+            CREATE TABLE bench_rows AS
+                SELECT i AS id, i % 100 AS owner_id FROM generate_series(1, {ROWS}) i;
+            ALTER TABLE bench_rows ENABLE ROW LEVEL SECURITY;
+            GRANT SELECT ON bench_rows TO test_user;
+            ANALYZE bench_rows;
+            """)
+        )
+
+    engine = instance.non_superadmin_engine
+    print(f"{'initplan':<12}{'ms/query':>12}{'ns/row':>10}")
+    for initplan in (False, True):
+        create_policy(instance.admin_engine, initplan)
+        run(engine)  # Warm up the buffers
+        latency = run(engine)
+        print(f"{str(initplan):<12}{latency:>12.1f}{latency * 1e6 / ROWS:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""JSON report of what the policies of the test models cost at query time,
+written to stdout or to the path given as the first argument, to be compared
+across runs in CI.
+
+Run with `python -m benchmarks.policy_overhead [report.json]` from the
+repository root.
+"""
+
+import sys
+
+from sqlalchemy import insert, select, text
+
+from rls.policy_overhead import measure_policy_overhead
+from test import database, models
+
+ROWS = 100_000
+QUERIES = [
+    select(models.Item.id, models.Item.title),
+    select(models.Item.title).where(models.Item.id < 100),
+    select(models.User.username),
+]
+
+
+def main():
+    instance = database.test_postgres_instance()
+    with instance.admin_engine.begin() as connection:
+        connection.execute(
+            insert(models.Item),
+            [
+                {"title": f"Item {i}", "description": None, "owner_id": i % 2 + 1}
+                for i in range(ROWS)
+            ],
+        )
+        connection.execute(text("ANALYZE items"))
+
+    report = measure_policy_overhead(
+        instance.non_superadmin_engine,
+        models.Base.metadata,
+        models.SampleRlsContext(account_id=1),
+        QUERIES,
+    )
+    report_json = report.model_dump_json(indent=2)
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "w") as report_file:
+            report_file.write(report_json)
+    else:
+        print(report_json)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,40 @@
-from typing import Type
+import json
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 
 import sqlalchemy as sa
+from alembic import util as alembic_util
 from alembic.autogenerate import comparators, renderers
 from alembic.operations import MigrateOperation, Operations
+from alembic.operations import ops as alembic_ops
 from sqlalchemy.dialects import postgresql as pg_dialect
 from sqlalchemy.ext.declarative import DeclarativeMeta
 
-from .schemas import Command, Policy
-from .utils import generate_rls_policy, policy_changed_checker
+from .index_advisor import (
+    get_missing_indexes,
+    get_policy_columns,
+    get_policy_index_name,
+)
+from .schemas import Command, Policy, normalize_role_name, normalize_roles
+from .utils import (
+    generate_accessor_function,
+    generate_rls_policy,
+    get_accessor_function_body,
+    get_accessor_function_types,
+    get_bypass_policy_name,
+    get_metadata_table_policies,
+    get_table_policies,
+    policy_changed_checker,
+)
 
 ############################
 # OPERATIONS
@@ -50,6 +77,40 @@ class DisableRlsOp(MigrateOperation):
         return EnableRlsOp(self.tablename, schemaname=self.schemaname)
 
 
+@Operations.register_operation("create_accessor_function")
+class CreateAccessorFunctionOp(MigrateOperation):
+    """Create or replace the `rls.<name>()` function reading a context field."""
+
+    def __init__(self, name, type_):
+        self.name = name
+        self.type_ = type_
+
+    @classmethod
+    def create_accessor_function(cls, operations, name, type_):
+        op = CreateAccessorFunctionOp(name, type_)
+        return operations.invoke(op)
+
+    def reverse(self):
+        return DropAccessorFunctionOp(self.name, self.type_)
+
+
+@Operations.register_operation("drop_accessor_function")
+class DropAccessorFunctionOp(MigrateOperation):
+    """Drop the `rls.<name>()` function reading a context field."""
+
+    def __init__(self, name, type_):
+        self.name = name
+        self.type_ = type_
+
+    @classmethod
+    def drop_accessor_function(cls, operations, name, type_):
+        op = DropAccessorFunctionOp(name, type_)
+        return operations.invoke(op)
+
+    def reverse(self):
+        return CreateAccessorFunctionOp(self.name, self.type_)
+
+
 ############################
 # IMPLEMENTATION
 ############################
@@ -73,6 +134,17 @@ def disable_rls(operations, operation):
     operations.execute("ALTER TABLE %s DISABLE ROW LEVEL SECURITY" % name)
 
 
+@Operations.implementation_for(CreateAccessorFunctionOp)
+def create_accessor_function(operations, operation):
+    for sql in generate_accessor_function(operation.name, operation.type_):
+        operations.execute(sql)
+
+
+@Operations.implementation_for(DropAccessorFunctionOp)
+def drop_accessor_function(operations, operation):
+    operations.execute(f"DROP FUNCTION IF EXISTS rls.{operation.name}()")
+
+
 ############################
 # RENDER
 ############################
@@ -88,11 +160,35 @@ def render_disable_rls(autogen_context, op):
     return "op.disable_rls(%r)  # type: ignore" % (op.tablename)
 
 
+@renderers.dispatch_for(CreateAccessorFunctionOp)
+def render_create_accessor_function(autogen_context, op):
+    return "op.create_accessor_function(%r, %r)  # type: ignore" % (op.name, op.type_)
+
+
+@renderers.dispatch_for(DropAccessorFunctionOp)
+def render_drop_accessor_function(autogen_context, op):
+    return "op.drop_accessor_function(%r, %r)  # type: ignore" % (op.name, op.type_)
+
+
 ############################
 # COMPARATORS
 ############################
 
 
+def _policy_from_row(policy_data: Dict[str, Any]) -> Policy:
+    """Map a row of `pg_policies` to a Policy."""
+    policy = Policy(
+        definition=policy_data.get("permissive", ""),
+        cmd=policy_data.get("cmd", ""),
+        custom_policy_name=policy_data.get("policyname", ""),
+        roles=policy_data.get("roles"),
+    )
+
+    # Set the expression (or any other additional fields) as needed
+    policy.expression = policy_data.get("with_check", "") or policy_data.get("qual", "")
+    return policy
+
+
 def check_rls_policies(conn, schemaname, tablename) -> list[Policy]:
     """Retrieve all RLS policies applied to a table from the database."""
     columns = ["policyname", "permissive", "cmd", "roles", "qual", "with_check"]
@@ -103,29 +199,9 @@ def check_rls_policies(conn, schemaname, tablename) -> list[Policy]:
         .where(sa.column("tablename") == tablename)
     )
     result = conn.execute(query).fetchall()
-    # Convert to a list of dictionaries
-    # result_dicts = [dict(zip(columns, row)) for row in result]
 
     # Convert query result to a list of Policy objects
-    policies = []
-    for row in result:
-        policy_data = dict(zip(columns, row))
-
-        # Map the database fields to Policy attributes
-        policy = Policy(
-            definition=policy_data.get("permissive", ""),
-            cmd=policy_data.get("cmd", ""),
-            custom_policy_name=policy_data.get("policyname", ""),
-        )
-
-        # Set the expression (or any other additional fields) as needed
-        policy.expression = policy_data.get("with_check", "") or policy_data.get(
-            "qual", ""
-        )
-
-        policies.append(policy)
-
-    return policies
+    return [_policy_from_row(dict(zip(columns, row))) for row in result]
 
 
 def check_table_exists(conn, schemaname, tablename) -> bool:
@@ -151,27 +227,238 @@ def check_rls_enabled(conn, schemaname, tablename) -> bool:
     return result
 
 
+def check_accessor_functions(conn) -> Dict[str, Tuple[str, str]]:
+    """Retrieve the return type and the body of the `rls.<name>()` functions."""
+    result = conn.execute(
+        sa.text("""
+        SELECT p.proname, CAST(CAST(p.prorettype AS regtype) AS text), p.prosrc
+        FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace
+        WHERE n.nspname = 'rls' AND p.pronargs = 0
+        """)
+    ).fetchall()
+    return {name: (type_, body) for name, type_, body in result}
+
+
+class TableCatalog(NamedTuple):
+    """What autogenerate compares of a table of the database."""
+
+    rls_enabled: bool
+    rls_forced: bool
+    # Rows of `pg_policies`, mapped to Policy objects by `get_policies`
+    policies: List[Dict[str, Any]]
+    # The columns the valid indexes of the table start with
+    indexed_columns: Set[str]
+
+    def get_policies(self) -> List[Policy]:
+        return [_policy_from_row(row) for row in self.policies]
+
+
+_RLS_CATALOG_QUERY = sa.text("""
+    SELECT
+        n.nspname,
+        c.relname,
+        c.relrowsecurity,
+        c.relforcerowsecurity,
+        COALESCE(
+            (
+                SELECT json_agg(json_build_object(
+                    'policyname', p.policyname,
+                    'permissive', p.permissive,
+                    'cmd', p.cmd,
+                    'roles', p.roles,
+                    'qual', p.qual,
+                    'with_check', p.with_check
+                ))
+                FROM pg_policies p
+                WHERE p.schemaname = n.nspname AND p.tablename = c.relname
+            ),
+            '[]'
+        ),
+        ARRAY(
+            SELECT CAST(a.attname AS text)
+            FROM pg_index i
+            JOIN pg_attribute a
+                ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+            WHERE i.indrelid = c.oid AND i.indisvalid
+        )
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind IN ('r', 'p')
+        AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+        AND n.nspname NOT LIKE 'pg_toast%'
+    """)
+
+
+def get_rls_catalog(autogen_context) -> Dict[Tuple[str, str], TableCatalog]:
+    """
+    The tables of the database indexed by (schema, table), read with a single
+    query the first time a comparator asks for them during an autogenerate run
+    and cached on its context for the other tables.
+    """
+    catalog = getattr(autogen_context, "_rls_catalog", None)
+    if catalog is None:
+        catalog = {}
+        result = autogen_context.connection.execute(_RLS_CATALOG_QUERY)
+        for schema, table, enabled, forced, policies, indexed_columns in result:
+            # Some drivers do not parse the json
+            if isinstance(policies, str):
+                policies = json.loads(policies)
+            catalog[(schema, table)] = TableCatalog(
+                enabled, forced, policies, set(indexed_columns)
+            )
+        autogen_context._rls_catalog = catalog
+    return catalog
+
+
+def check_accessor_function_policies(conn, name) -> List[Tuple[str, str, str]]:
+    """The schema, table and name of the policies using the `rls.<name>()` function."""
+    result = conn.execute(
+        sa.text("""
+        SELECT n.nspname, c.relname, p.polname
+        FROM pg_depend d
+        JOIN pg_policy p ON p.oid = d.objid
+        JOIN pg_class c ON c.oid = p.polrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE d.classid = CAST('pg_policy' AS regclass)
+            AND d.refclassid = CAST('pg_proc' AS regclass)
+            AND d.refobjid = CAST(:function AS regprocedure)
+        ORDER BY n.nspname, c.relname, p.polname
+        """),
+        {"function": f"rls.{name}()"},
+    ).fetchall()
+    return [tuple(row) for row in result]
+
+
+def _get_dependent_policy_ops(
+    autogen_context, metadatas: List[sa.MetaData], name: str, type_db: str, type_: str
+) -> Tuple[List[MigrateOperation], List[MigrateOperation]]:
+    """
+    The operations dropping the policies using the `rls.<name>()` function
+    before its return type changes, and creating them again from the metadata
+    afterwards.
+    """
+    catalog = get_rls_catalog(autogen_context)
+    drop_ops: List[MigrateOperation] = []
+    create_ops: List[MigrateOperation] = []
+    for schemaname, tablename, policy_name in check_accessor_function_policies(
+        autogen_context.connection, name
+    ):
+        metadata = next(
+            (m for m in metadatas if tablename in m.info.get("rls_policies", {})),
+            None,
+        )
+        policy_meta = next(
+            (
+                p
+                for p in (
+                    get_metadata_table_policies(metadata, tablename)
+                    if metadata is not None
+                    else []
+                )
+                if p.custom_policy_name == policy_name
+            ),
+            None,
+        )
+        if metadata is None or policy_meta is None:
+            raise ValueError(
+                f"The return type of rls.{name}() changes from {type_db} to "
+                f"{type_}, but the policy `{policy_name}` on `{tablename}` using "
+                "it is not in the metadata, drop it in a previous migration."
+            )
+        bypass_role = metadata.info.get("rls_bypass_role")
+        policy_db = next(
+            p
+            for p in catalog[(schemaname, tablename)].get_policies()
+            if p.custom_policy_name == policy_name
+        )
+        drop_ops.append(
+            DropPolicyOp(
+                table_name=tablename,
+                definition=policy_db.definition,
+                policy_name=policy_name,
+                cmd=Command(policy_db.cmd).value,
+                expr=policy_db.expression,
+                roles=policy_db.roles,
+                bypass_role=bypass_role,
+                add_bypass=False,
+            )
+        )
+        create_ops.append(
+            CreatePolicyOp(
+                table_name=tablename,
+                definition=policy_meta.definition,
+                policy_name=policy_name,
+                cmd=Command(policy_meta.cmd).value,
+                expr=policy_meta.expression,
+                roles=policy_meta.roles,
+                bypass_role=bypass_role,
+            )
+        )
+    return drop_ops, create_ops
+
+
+@comparators.dispatch_for("schema")
+def compare_accessor_functions(autogen_context, upgrade_ops, schemas):
+    # `target_metadata` may be a list of metadata
+    metadatas = [
+        metadata
+        for metadata in alembic_util.to_list(autogen_context.metadata, [])
+        if "rls_accessor_functions" in metadata.info
+    ]
+    if not metadatas:
+        return
+    functions_meta: Dict[str, str] = {}
+    for metadata in metadatas:
+        functions_meta.update(metadata.info["rls_accessor_functions"])
+    conn = autogen_context.connection
+    functions_db = check_accessor_functions(conn)
+
+    # The functions are created before the policies using them and dropped
+    # after the policies which used them
+    create_ops: List[MigrateOperation] = []
+    for name, type_ in functions_meta.items():
+        if name not in functions_db:
+            create_ops.append(CreateAccessorFunctionOp(name, type_))
+            continue
+        type_db, body_db = functions_db[name]
+        # Normalize the type name as postgres displays it
+        type_meta = conn.execute(
+            sa.text("SELECT CAST(CAST(:type AS regtype) AS text)"), {"type": type_}
+        ).scalar()
+        if type_db != type_meta:
+            # A function can not be replaced by one returning another type, nor
+            # dropped while policies use it, those are created again after it
+            drop_policy_ops, create_policy_ops = _get_dependent_policy_ops(
+                autogen_context, metadatas, name, type_db, type_
+            )
+            create_ops.extend(drop_policy_ops)
+            create_ops.append(DropAccessorFunctionOp(name, type_db))
+            create_ops.append(CreateAccessorFunctionOp(name, type_))
+            create_ops.extend(create_policy_ops)
+        elif body_db.strip() != get_accessor_function_body(name, type_):
+            create_ops.append(CreateAccessorFunctionOp(name, type_))
+    upgrade_ops.ops[:0] = create_ops
+
+    for name, (type_db, _) in functions_db.items():
+        if name not in functions_meta:
+            upgrade_ops.ops.append(DropAccessorFunctionOp(name, type_db))
+
+
 @comparators.dispatch_for("table")
 def compare_table_level(
     autogen_context, modify_ops, schemaname, tablename, conn_table, metadata_table
 ):
     # STEP 1. check if the table exists
-    table_exists = check_table_exists(autogen_context.connection, schemaname, tablename)
+    table_db = get_rls_catalog(autogen_context).get((schemaname or "public", tablename))
 
     # STEP 2. Retrieve current RLS policies from the database
-    rls_enabled_db = (
-        check_rls_enabled(autogen_context.connection, schemaname, tablename)
-        if table_exists
-        else False
-    )
-    rls_policies_db = (
-        check_rls_policies(autogen_context.connection, schemaname, tablename)
-        if rls_enabled_db
-        else []
-    )
+    rls_enabled_db = table_db is not None and table_db.rls_enabled
+    rls_policies_db = table_db.get_policies() if rls_enabled_db else []
 
     # STEP 3. Get RLS policies defined in the metadata
     rls_enabled_meta = tablename in metadata_table.metadata.info["rls_policies"]
+    bypass_role = metadata_table.metadata.info.get("rls_bypass_role")
+    accessor_functions = "rls_accessor_functions" in metadata_table.metadata.info
+    consolidate = metadata_table.metadata.info.get("rls_consolidate_policies", False)
     rls_policies_meta = (
         metadata_table.metadata.info["rls_policies"].get(tablename, [])
         if rls_enabled_meta
@@ -184,76 +471,139 @@ def compare_table_level(
     if rls_enabled_db and not rls_enabled_meta:
         modify_ops.ops.append(DisableRlsOp(tablename=tablename, schemaname=schemaname))
 
+    # STEP 4.5. Index the columns the policies reference, when asked to with the
+    # `rls_create_policy_indexes` option of the migration context
+    if rls_policies_meta and autogen_context.opts.get("rls_create_policy_indexes"):
+        indexed_columns = set(table_db.indexed_columns) if table_db else set()
+        # The indexes of the metadata are created by alembic itself
+        for columns in [
+            metadata_table.primary_key.columns,
+            *(index.columns for index in metadata_table.indexes),
+            *(
+                constraint.columns
+                for constraint in metadata_table.constraints
+                if isinstance(constraint, sa.UniqueConstraint)
+            ),
+        ]:
+            indexed_columns.update(column.name for column in list(columns)[:1])
+        for missing_index in get_missing_indexes(
+            tablename, rls_policies_meta, indexed_columns
+        ):
+            modify_ops.ops.append(
+                alembic_ops.CreateIndexOp(
+                    get_policy_index_name(tablename, missing_index.column_name),
+                    tablename,
+                    [missing_index.column_name],
+                    schema=schemaname,
+                )
+            )
+
     # STEP 5. Compare and manage individual policies (add, remove, update)
-    for idx, policy_meta in enumerate(rls_policies_meta):
-        policy_meta.get_sql_policies(table_name=tablename, name_suffix=str(idx))
+    table_policies_meta = get_table_policies(
+        tablename,
+        rls_policies_meta,
+        bypass_role=bypass_role,
+        accessor_functions=accessor_functions,
+        consolidate=consolidate,
+    )
+    for policy_meta in table_policies_meta:
+        single_policy_name = policy_meta.custom_policy_name
+        current_cmd = Command(policy_meta.cmd).value
         policy_expr = policy_meta.expression
-        for ix, single_policy_name in enumerate(policy_meta.policy_names):
-            current_cmd = ""
-            if isinstance(policy_meta.cmd, list):
-                if isinstance(policy_meta.cmd[ix], Command):
-                    current_cmd = policy_meta.cmd[ix].value
-                else:
-                    current_cmd = policy_meta.cmd[ix]
-            else:
-                if isinstance(policy_meta.cmd, Command):
-                    current_cmd = policy_meta.cmd.value
-                else:
-                    current_cmd = policy_meta.cmd
-
-            matched_policy = next(
-                (
-                    p
-                    for p in rls_policies_db
-                    if p.custom_policy_name == single_policy_name
-                ),
-                None,
+
+        matched_policy = next(
+            (p for p in rls_policies_db if p.custom_policy_name == single_policy_name),
+            None,
+        )
+        if not matched_policy:
+            # Policy exists in metadata but not in the database, so create it
+            modify_ops.ops.append(
+                CreatePolicyOp(
+                    table_name=tablename,
+                    definition=policy_meta.definition,
+                    policy_name=single_policy_name,
+                    cmd=current_cmd,
+                    expr=policy_expr,
+                    roles=policy_meta.roles,
+                    bypass_role=bypass_role,
+                )
+            )
+
+        elif not policy_changed_checker(
+            db_policy=matched_policy,
+            metadata_policy=policy_meta,
+            bypass_role=bypass_role,
+        ):
+            # Policy exists in both metadata and database but has changed,
+            # so drop and recreate it
+            # Notice: Matched policy is db policy
+            modify_ops.ops.append(
+                DropPolicyOp(
+                    table_name=tablename,
+                    definition=matched_policy.definition,
+                    policy_name=matched_policy.custom_policy_name,
+                    cmd=current_cmd,
+                    expr=matched_policy.expression,
+                    roles=matched_policy.roles,
+                    bypass_role=bypass_role,
+                    add_bypass=False,
+                )
             )
-            if not matched_policy:
-                # Policy exists in metadata but not in the database, so create it
-                modify_ops.ops.append(
-                    CreatePolicyOp(
-                        table_name=tablename,
-                        definition=policy_meta.definition,
-                        policy_name=single_policy_name,
-                        cmd=current_cmd,
-                        expr=policy_expr,
-                    )
+            modify_ops.ops.append(
+                CreatePolicyOp(
+                    table_name=tablename,
+                    definition=policy_meta.definition,
+                    policy_name=single_policy_name,
+                    cmd=current_cmd,
+                    expr=policy_expr,
+                    roles=policy_meta.roles,
+                    bypass_role=bypass_role,
                 )
+            )
 
-            else:
-                # Policy exists in both metadata and database, so check if it needs to be updated
-                # Notice: Matched policy is db policy
-                tmp_policy_meta = policy_meta.model_copy()
-                tmp_policy_meta.cmd = Command(current_cmd)
-                if not policy_changed_checker(
-                    db_policy=matched_policy, metadata_policy=tmp_policy_meta
-                ):
-                    # Policy has changed, so drop and recreate it
-                    modify_ops.ops.append(
-                        DropPolicyOp(
-                            table_name=tablename,
-                            definition=matched_policy.definition,
-                            policy_name=matched_policy.custom_policy_name,
-                            cmd=current_cmd,
-                            expr=matched_policy.expression,
-                        )
-                    )
-                    modify_ops.ops.append(
-                        CreatePolicyOp(
-                            table_name=tablename,
-                            definition=policy_meta.definition,
-                            policy_name=single_policy_name,
-                            cmd=current_cmd,
-                            expr=policy_expr,
-                        )
-                    )
+    # STEP 5.1. With a bypass role, the table has a policy letting it bypass RLS
+    bypass_policy_name = get_bypass_policy_name(tablename)
+    if rls_enabled_meta and bypass_role is not None:
+        matched_policy = next(
+            (p for p in rls_policies_db if p.custom_policy_name == bypass_policy_name),
+            None,
+        )
+        # The roles are folded to lowercase by postgres
+        bypass_policy_changed = matched_policy is None or normalize_roles(
+            matched_policy.roles
+        ) != normalize_roles([bypass_role])
+        if matched_policy is not None and bypass_policy_changed:
+            modify_ops.ops.append(
+                DropPolicyOp(
+                    table_name=tablename,
+                    definition=matched_policy.definition,
+                    policy_name=bypass_policy_name,
+                    cmd=Command.all.value,
+                    expr=matched_policy.expression,
+                    roles=matched_policy.roles,
+                    bypass_role=bypass_role,
+                    add_bypass=False,
+                )
+            )
+        if bypass_policy_changed:
+            modify_ops.ops.append(
+                CreatePolicyOp(
+                    table_name=tablename,
+                    definition="PERMISSIVE",
+                    policy_name=bypass_policy_name,
+                    cmd=Command.all.value,
+                    expr="true",
+                    roles=[bypass_role],
+                    bypass_role=bypass_role,
+                )
+            )
 
     # Step 5.5 : Get all policy meta names
     all_metadata_policy_names = []
-    for policy_meta in rls_policies_meta:
-        policy_meta.get_sql_policies(table_name=tablename)
-        all_metadata_policy_names.extend(policy_meta.policy_names)
+    if bypass_role is not None:
+        all_metadata_policy_names.append(bypass_policy_name)
+    for policy_meta in table_policies_meta:
+        all_metadata_policy_names.append(policy_meta.custom_policy_name)
 
     # Step 6. Check if there are any policies in the database that are not in the metadata
     for policy_db in rls_policies_db:
@@ -270,6 +620,8 @@ def compare_table_level(
                     policy_name=policy_db.custom_policy_name,
                     cmd=policy_db.cmd.value,
                     expr=policy_db.expression,
+                    roles=policy_db.roles,
+                    add_bypass=False,
                 )
             )
 
@@ -278,12 +630,26 @@ def compare_table_level(
 class CreatePolicyOp(MigrateOperation):
     """Operation to create a new RLS policy."""
 
-    def __init__(self, table_name, policy_name, definition, cmd, expr):
+    def __init__(
+        self,
+        table_name,
+        policy_name,
+        definition,
+        cmd,
+        expr,
+        roles: Optional[List[str]] = None,
+        bypass_role: Optional[str] = None,
+        add_bypass: bool = True,
+    ):
         self.table_name = table_name
         self.definition = definition
         self.cmd = cmd
         self.expr = expr
         self.policy_name = policy_name
+        self.roles = roles
+        self.bypass_role = bypass_role
+        # False when `expr` was read from the database, with its bypass check
+        self.add_bypass = add_bypass
 
     @classmethod
     def create_policy(cls, operations, table_name, definition, cmd, expr, **kw):
@@ -299,6 +665,9 @@ class CreatePolicyOp(MigrateOperation):
             definition=self.definition,
             cmd=self.cmd,
             expr=self.expr,
+            roles=self.roles,
+            bypass_role=self.bypass_role,
+            add_bypass=self.add_bypass,
         )
 
 
@@ -306,12 +675,26 @@ class CreatePolicyOp(MigrateOperation):
 class DropPolicyOp(MigrateOperation):
     """Operation to drop an RLS policy."""
 
-    def __init__(self, table_name, policy_name, definition, cmd, expr):
+    def __init__(
+        self,
+        table_name,
+        policy_name,
+        definition,
+        cmd,
+        expr,
+        roles: Optional[List[str]] = None,
+        bypass_role: Optional[str] = None,
+        add_bypass: bool = True,
+    ):
         self.table_name = table_name
         self.definition = definition
         self.cmd = cmd
         self.expr = expr
         self.policy_name = policy_name
+        self.roles = roles
+        self.bypass_role = bypass_role
+        # False when `expr` was read from the database, with its bypass check
+        self.add_bypass = add_bypass
 
     @classmethod
     def drop_policy(
@@ -335,6 +718,9 @@ class DropPolicyOp(MigrateOperation):
             definition=self.definition,
             cmd=self.cmd,
             expr=self.expr,
+            roles=self.roles,
+            bypass_role=self.bypass_role,
+            add_bypass=self.add_bypass,
         )
 
 
@@ -354,6 +740,9 @@ def create_policy(operations, operation):
         policy_name=policy_name,
         table_name=table_name,
         expr=expr,
+        roles=operation.roles,
+        bypass_role=operation.bypass_role,
+        add_bypass=operation.add_bypass,
     )
 
     operations.execute(sql)
@@ -365,19 +754,84 @@ def drop_policy(operations, operation):
     operations.execute(sql)
 
 
+def _render_policy_kwargs(op) -> str:
+    """Renders the optional arguments of a policy op, when they are set."""
+    kwargs = ""
+    if op.roles is not None:
+        kwargs += f", roles={op.roles!r}"
+    if op.bypass_role is not None:
+        kwargs += f", bypass_role={op.bypass_role!r}"
+    if not op.add_bypass:
+        kwargs += ", add_bypass=False"
+    return kwargs
+
+
 @renderers.dispatch_for(CreatePolicyOp)
 def render_create_policy(autogen_context, op):
-    return f"op.create_policy(table_name={op.table_name!r}, policy_name={op.policy_name!r}, cmd={op.cmd!r}, definition='{op.definition}', expr=\"{op.expr}\") # type: ignore"
+    return f"op.create_policy(table_name={op.table_name!r}, policy_name={op.policy_name!r}, cmd={op.cmd!r}, definition='{op.definition}', expr=\"{op.expr}\"{_render_policy_kwargs(op)}) # type: ignore"
 
 
 @renderers.dispatch_for(DropPolicyOp)
 def render_drop_policy(autogen_context, op):
-    return f"op.drop_policy(table_name={op.table_name!r}, policy_name={op.policy_name!r}, cmd={op.cmd!r}, definition='{op.definition}', expr=\"{op.expr}\") # type: ignore"
+    return f"op.drop_policy(table_name={op.table_name!r}, policy_name={op.policy_name!r}, cmd={op.cmd!r}, definition='{op.definition}', expr=\"{op.expr}\"{_render_policy_kwargs(op)}) # type: ignore"
+
+
+def include_policy_indexes(
+    metadata: sa.MetaData, include_object: Optional[Callable[..., bool]] = None
+) -> Callable[..., bool]:
+    """
+    Returns an `include_object` hook for `context.configure` leaving out of
+    the comparison the indexes of the database the `rls_create_policy_indexes`
+    option created, which are not in the metadata. Without it the next
+    autogenerate drops them. `include_object`, if given, is applied first.
+    Usage: context.configure(
+               ...,
+               rls_create_policy_indexes=True,
+               include_object=include_policy_indexes(target_metadata),
+           )
+    """
+
+    def include(object_, name, type_, reflected, compare_to) -> bool:
+        if include_object is not None and not include_object(
+            object_, name, type_, reflected, compare_to
+        ):
+            return False
+        if type_ != "index" or not reflected or compare_to is not None:
+            return True
+        tablename = object_.table.name
+        policy_index_names = {
+            get_policy_index_name(tablename, column_name)
+            for policy in metadata.info.get("rls_policies", {}).get(tablename, [])
+            for column_name in get_policy_columns(policy, tablename)
+        }
+        return name not in policy_index_names
+
+    return include
+
+
+def set_metadata_info(
+    Base: Type[DeclarativeMeta],
+    bypass_role: Optional[str] = None,
+    accessor_functions: bool = False,
+    consolidate_policies: bool = False,
+):
+    """
+    RLS policies are first added to the Metadata before applied.
+
+    With `bypass_role`, the policies do not check the `rls.bypass_rls` setting,
+    instead each table gets a permissive policy letting that role bypass RLS.
 
+    With `accessor_functions`, the policies read each condition arg through a
+    `rls.<comparator_name>()` function instead of `current_setting(...)`.
 
-def set_metadata_info(Base: Type[DeclarativeMeta]):
-    """RLS policies are first added to the Metadata before applied."""
+    With `consolidate_policies`, the permissive policies of a table are merged
+    into as few policies as possible, see `utils.consolidate_policies`.
+    """
     Base.metadata.info.setdefault("rls_policies", dict())
+    if bypass_role is not None:
+        Base.metadata.info["rls_bypass_role"] = normalize_role_name(bypass_role)
+    if consolidate_policies:
+        Base.metadata.info["rls_consolidate_policies"] = True
     for mapper in Base.registry.mappers:
         if not hasattr(mapper.class_, "__rls_policies__"):
             continue
@@ -385,5 +839,11 @@ def set_metadata_info(Base: Type[DeclarativeMeta]):
         Base.metadata.info["rls_policies"][mapper.tables[0].fullname] = (
             mapper.class_.__rls_policies__
         )
+    if accessor_functions:
+        Base.metadata.info["rls_accessor_functions"] = get_accessor_function_types(
+            policy
+            for policies in Base.metadata.info["rls_policies"].values()
+            for policy in policies
+        )
 
     return Base
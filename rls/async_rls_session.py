@@ -0,0 +1,76 @@
+from typing import Optional
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from rls.rls_session import ContextMode, RlsSession
+
+
+class AsyncRlsSession(AsyncSession):
+    """
+    asyncio version of `RlsSession`, for `sqlalchemy.ext.asyncio` engines
+    such as `postgresql+asyncpg`. The context is applied by the proxied
+    `RlsSession` so both sessions behave the same.
+    """
+
+    sync_session_class = RlsSession
+    sync_session: RlsSession
+
+    def __init__(
+        self,
+        context: Optional[BaseModel] = None,
+        *args,
+        context_mode: ContextMode = ContextMode.set_config,
+        **kwargs,
+    ):
+        super().__init__(*args, context=context, context_mode=context_mode, **kwargs)
+
+    @property
+    def context(self) -> Optional[BaseModel]:
+        return self.sync_session.context
+
+    def get_context(self):
+        return self.sync_session.get_context()
+
+    def set_context(self, context):
+        self.sync_session.set_context(context)
+
+    async def stream_batches(self, statement, batch_size: int = 1000, **kwargs):
+        """
+        Async generator version of `RlsSession.stream_batches`.
+        Usage: async for rows in session.stream_batches(select(Item)):
+        """
+        result = await self.stream(
+            statement,
+            execution_options={"yield_per": batch_size},
+            **kwargs,
+        )
+        try:
+            async for rows in result.partitions():
+                yield rows
+        finally:
+            await result.close()
+
+    def bypass_rls(self):
+        """
+        Async context manager to bypass RLS.
+        Usage: async with session.bypass_rls() as session:
+        """
+        return self.BypassRLSContext(self)
+
+    class BypassRLSContext:
+        def __init__(self, session: "AsyncRlsSession"):
+            self.session = session
+            self.sync_context = session.sync_session.bypass_rls()
+
+        async def __aenter__(self):
+            await self.session.run_sync(lambda _: self.sync_context.__enter__())
+            return self.session
+
+        async def __aexit__(self, exc_type, exc_val, exc_tb):
+            await self.session.run_sync(
+                lambda _: self.sync_context.__exit__(exc_type, exc_val, exc_tb)
+            )
+
+        async def execute(self, *args, **kwargs):
+            return await self.session.execute(*args, **kwargs)
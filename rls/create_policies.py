@@ -4,9 +4,22 @@ from sqlalchemy import text
 from sqlalchemy.engine import Connection
 from sqlalchemy.ext.declarative import DeclarativeMeta
 
+from .utils import (
+    generate_accessor_function,
+    generate_bypass_rls_policy,
+    generate_table_policy,
+    get_table_policies,
+)
+
 
 def create_policies(Base: Type[DeclarativeMeta], connection: Connection):
     """Create policies for `Base.metadata.create_all()`."""
+    bypass_role = Base.metadata.info.get("rls_bypass_role")
+    accessor_functions = Base.metadata.info.get("rls_accessor_functions")
+    # functions, before the policies using them
+    for name, type_ in (accessor_functions or {}).items():
+        for stmt in generate_accessor_function(name, type_):
+            connection.execute(stmt)
     for table, settings in Base.metadata.info["rls_policies"].items():
         # enable
         stmt = text(f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY;")
@@ -15,9 +28,30 @@ def create_policies(Base: Type[DeclarativeMeta], connection: Connection):
         stmt = text(f"ALTER TABLE {table} FORCE ROW LEVEL SECURITY;")
         connection.execute(stmt)
         # policies
-        for ix, policy in enumerate(settings):
-            for pol_stmt in policy.get_sql_policies(
-                table_name=table, name_suffix=str(ix)
-            ):
-                connection.execute(pol_stmt)
+        if Base.metadata.info.get("rls_consolidate_policies"):
+            policy_stmts = [
+                generate_table_policy(table, policy, bypass_role)
+                for policy in get_table_policies(
+                    table,
+                    settings,
+                    bypass_role=bypass_role,
+                    accessor_functions=accessor_functions is not None,
+                    consolidate=True,
+                )
+            ]
+        else:
+            policy_stmts = [
+                pol_stmt
+                for ix, policy in enumerate(settings)
+                for pol_stmt in policy.get_sql_policies(
+                    table_name=table,
+                    name_suffix=str(ix),
+                    bypass_role=bypass_role,
+                    accessor_functions=accessor_functions is not None,
+                )
+            ]
+        for pol_stmt in policy_stmts:
+            connection.execute(pol_stmt)
+        if bypass_role is not None:
+            connection.execute(generate_bypass_rls_policy(table, bypass_role))
     connection.commit()
@@ -0,0 +1,112 @@
+from typing import List, NamedTuple, Optional, Set, Type
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.declarative import DeclarativeMeta
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import ColumnClause
+
+from .schemas import Policy
+
+
+class MissingIndex(NamedTuple):
+    table_name: str
+    column_name: str
+    # The first policy referencing the column
+    policy_name: str
+
+    def __str__(self):
+        return (
+            f"{self.table_name}.{self.column_name} is referenced by "
+            f"{self.policy_name} but no index starts with it"
+        )
+
+
+def get_policy_columns(policy: Policy, table_name: Optional[str] = None) -> List[str]:
+    """
+    The columns of `table_name` the expression of a policy references, found
+    by walking the clause `custom_expr` returns. Columns of other tables, in
+    subqueries for instance, are left out.
+    """
+    if policy.custom_expr is None:
+        return []
+    args = [
+        sa.bindparam(arg.comparator_name, type_=arg.type)
+        for arg in policy.condition_args or []
+    ]
+    columns: List[str] = []
+    for element in visitors.iterate(policy.custom_expr(*args)):
+        if not isinstance(element, ColumnClause) or element.is_literal:
+            continue
+        table = element.table
+        if table is not None and not (
+            isinstance(table, sa.TableClause) and table.name == table_name
+        ):
+            continue
+        name = element.name
+        if name.startswith("{") and name.endswith("}"):
+            # A template column, see `template_column`
+            name = policy.template_columns.get(name[1:-1], name)
+        if name not in columns:
+            columns.append(name)
+    return columns
+
+
+def get_policy_index_name(table_name: str, column_name: str) -> str:
+    """The name of the index autogenerate creates for a policy column."""
+    return f"ix_{table_name}_{column_name}"
+
+
+def check_indexed_columns(
+    conn: Connection, schemaname: Optional[str], tablename: str
+) -> Set[str]:
+    """The columns the valid indexes of a table start with."""
+    fq_tablename = f"{schemaname}.{tablename}" if schemaname else tablename
+    result = conn.execute(
+        sa.text("""
+        SELECT a.attname
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = CAST(:table AS regclass) AND i.indisvalid
+        """),
+        {"table": fq_tablename},
+    )
+    return set(result.scalars())
+
+
+def get_missing_indexes(
+    table_name: str, policies: List[Policy], indexed_columns: Set[str]
+) -> List[MissingIndex]:
+    """The columns referenced by `policies` which no index starts with."""
+    missing: List[MissingIndex] = []
+    for idx, policy in enumerate(policies):
+        for column_name in get_policy_columns(policy, table_name):
+            if column_name in indexed_columns or any(
+                m.column_name == column_name for m in missing
+            ):
+                continue
+            policy.get_sql_policies(table_name=table_name, name_suffix=str(idx))
+            missing.append(
+                MissingIndex(table_name, column_name, policy.policy_names[0])
+            )
+    return missing
+
+
+def find_missing_policy_indexes(
+    connection: Connection, Base: Type[DeclarativeMeta]
+) -> List[MissingIndex]:
+    """
+    Reports the columns referenced by the policies of the registered models
+    which no index of the database starts with. Every policy runs on each
+    query against its table, so those columns should usually be indexed.
+    Usage: for missing_index in find_missing_policy_indexes(connection, Base):
+               print(missing_index)
+    """
+    missing: List[MissingIndex] = []
+    for table_name, policies in Base.metadata.info["rls_policies"].items():
+        schemaname, _, tablename = table_name.rpartition(".")
+        indexed_columns = check_indexed_columns(
+            connection, schemaname or None, tablename
+        )
+        missing.extend(get_missing_indexes(tablename, policies, indexed_columns))
+    return missing
@@ -0,0 +1,156 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from pydantic import BaseModel
+from sqlalchemy import Engine, MetaData, text
+from sqlalchemy.sql.elements import ClauseElement
+
+from .rls_session import RlsSession
+from .schemas import Command
+from .utils import get_metadata_table_policies
+
+# Commands of the policies filtering the rows a query reads
+_READ_COMMANDS = {Command.select.value, Command.all.value}
+
+
+class PlanStats(BaseModel):
+    """Timings, in milliseconds, and buffers of an `EXPLAIN (ANALYZE, BUFFERS)`."""
+
+    planning_time: float
+    execution_time: float
+    shared_hit_blocks: int
+    shared_read_blocks: int
+    # Rows returned by the top node of the plan
+    actual_rows: int
+    # Node types of the plan, depth first, e.g. ["Aggregate", "Seq Scan"]
+    plan_shape: List[str]
+
+
+class QueryOverhead(BaseModel):
+    query: str
+    with_rls: PlanStats
+    bypassed: PlanStats
+    # Execution time added by the policies
+    overhead: float
+
+
+class PolicyOverhead(BaseModel):
+    table_name: str
+    policy_name: str
+    expression: str
+    # `SELECT count(*)` of the table with RLS bypassed, without then with the
+    # policy expression as its only filter
+    baseline: PlanStats
+    with_policy: PlanStats
+    # Execution time added by the policy expression, negative when the rows it
+    # filters out cost more than evaluating it
+    overhead: float
+
+
+class OverheadReport(BaseModel):
+    queries: List[QueryOverhead]
+    policies: List[PolicyOverhead]
+
+
+def _get_plan_shape(plan: Dict[str, Any]) -> List[str]:
+    shape = [plan["Node Type"]]
+    for subplan in plan.get("Plans", []):
+        shape.extend(_get_plan_shape(subplan))
+    return shape
+
+
+def explain(session: RlsSession, query: str, repeat: int = 1) -> PlanStats:
+    """
+    Runs `EXPLAIN (ANALYZE, BUFFERS)` on `query` `repeat` times and keeps the
+    fastest run. The query is executed, run it in a transaction rolled back
+    afterwards if it writes.
+    """
+    runs = []
+    for _ in range(repeat):
+        result = session.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}")
+        ).scalar()
+        # Some drivers do not parse the json
+        [explained] = json.loads(result) if isinstance(result, str) else result
+        runs.append(
+            PlanStats(
+                planning_time=explained["Planning Time"],
+                execution_time=explained["Execution Time"],
+                shared_hit_blocks=explained["Plan"].get("Shared Hit Blocks", 0),
+                shared_read_blocks=explained["Plan"].get("Shared Read Blocks", 0),
+                actual_rows=explained["Plan"]["Actual Rows"],
+                plan_shape=_get_plan_shape(explained["Plan"]),
+            )
+        )
+    return min(runs, key=lambda stats: stats.execution_time)
+
+
+def measure_policy_overhead(
+    engine: Engine,
+    metadata: MetaData,
+    context: BaseModel,
+    queries: Sequence[Union[str, ClauseElement]],
+    repeat: int = 3,
+    bypass_role: Optional[str] = None,
+) -> OverheadReport:
+    """
+    Measures what the policies registered in `metadata.info["rls_policies"]`
+    cost at query time, for a user of `engine` under `context`:
+    - each query is explained with the context applied and with RLS bypassed,
+      with `bypass_role` or the one registered on `metadata`, if any
+    - the expression of each policy filtering reads, compiled as the database
+      has it, is explained as the only filter of a `SELECT count(*)` of its
+      table, against the bare count
+
+    Everything runs in a transaction which is rolled back. The report is a
+    pydantic model, `report.model_dump_json()` gives a report to compare
+    across runs, in CI for instance.
+    """
+    query_overheads = []
+    policy_overheads = []
+    if bypass_role is None:
+        bypass_role = metadata.info.get("rls_bypass_role")
+    with RlsSession(context=context, bind=engine, bypass_role=bypass_role) as session:
+        for query in queries:
+            if not isinstance(query, str):
+                query = str(
+                    query.compile(
+                        dialect=engine.dialect, compile_kwargs={"literal_binds": True}
+                    )
+                )
+            with_rls = explain(session, query, repeat)
+            with session.bypass_rls():
+                bypassed = explain(session, query, repeat)
+            query_overheads.append(
+                QueryOverhead(
+                    query=query,
+                    with_rls=with_rls,
+                    bypassed=bypassed,
+                    overhead=with_rls.execution_time - bypassed.execution_time,
+                )
+            )
+
+        with session.bypass_rls():
+            for table_name in metadata.info["rls_policies"]:
+                count = f"SELECT count(*) FROM {table_name}"
+                baseline = explain(session, count, repeat)
+                for policy in get_metadata_table_policies(metadata, table_name):
+                    if Command(policy.cmd).value not in _READ_COMMANDS:
+                        continue
+                    with_policy = explain(
+                        session, f"{count} WHERE {policy.expression}", repeat
+                    )
+                    policy_overheads.append(
+                        PolicyOverhead(
+                            table_name=table_name,
+                            policy_name=str(policy.custom_policy_name),
+                            expression=policy.expression,
+                            baseline=baseline,
+                            with_policy=with_policy,
+                            overhead=(
+                                with_policy.execution_time - baseline.execution_time
+                            ),
+                        )
+                    )
+        session.rollback()
+    return OverheadReport(queries=query_overheads, policies=policy_overheads)
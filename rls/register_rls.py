@@ -1,4 +1,4 @@
-from typing import Type
+from typing import Optional, Type
 
 from sqlalchemy import event
 from sqlalchemy.ext.declarative import DeclarativeMeta
@@ -8,14 +8,36 @@ from rls.alembic_rls import set_metadata_info
 from .create_policies import create_policies
 
 
-def register_rls(Base: Type[DeclarativeMeta]):
+def register_rls(
+    Base: Type[DeclarativeMeta],
+    bypass_role: Optional[str] = None,
+    accessor_functions: bool = False,
+    consolidate_policies: bool = False,
+):
+    """
+    Registers the RLS policies of the models. With `bypass_role` RLS is
+    bypassed by switching to that role, with `accessor_functions` the policies
+    read the context through `rls.<field>()` functions and with
+    `consolidate_policies` the permissive policies are merged, see
+    `set_metadata_info`.
+    """
     # required for `alembic revision --autogenerate``
-    set_metadata_info(Base)
+    set_metadata_info(
+        Base,
+        bypass_role=bypass_role,
+        accessor_functions=accessor_functions,
+        consolidate_policies=consolidate_policies,
+    )
 
     @event.listens_for(Base.metadata, "after_create")
     def receive_after_create(target, connection, tables, **kw):
         # required for `Base.metadata.create_all()`
-        set_metadata_info(Base)
+        set_metadata_info(
+            Base,
+            bypass_role=bypass_role,
+            accessor_functions=accessor_functions,
+            consolidate_policies=consolidate_policies,
+        )
         create_policies(Base, connection)
 
     return Base
@@ -0,0 +1,396 @@
+import contextlib
+import contextvars
+import functools
+from collections.abc import Hashable
+from enum import Enum
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from pydantic import BaseModel
+from sqlalchemy import Connection, Dialect, Engine, TextClause, event, text
+from sqlalchemy.engine.interfaces import Compiled
+
+from rls.rls_pool import _RLS_CONTEXT_INFO_KEY, ContextValues, TenantAffinityPool
+from rls.schemas import normalize_role_name
+
+
+class ContextMode(str, Enum):
+    # one `SET rls.<key> = <value>` statement per context field
+    set = "SET"
+    # a single `SELECT set_config(...), ...` statement with bound values
+    set_config = "SET_CONFIG"
+    # like `set_config` but scoped to the transaction, nothing is left on the
+    # pooled connection which makes it safe with pgbouncer transaction pooling
+    set_config_local = "SET_CONFIG_LOCAL"
+
+
+# Key of the connection info holding the session level settings applied to it
+_RLS_SETTINGS_INFO_KEY = "rls_settings"
+
+
+class CompiledContext(NamedTuple):
+    statements: List[TextClause]
+    params: Dict[str, Optional[str]]
+    # names of the session level settings left on the connection
+    settings: FrozenSet[str]
+    # the session level settings and their values, empty in local mode
+    session_values: ContextValues
+    bypass: bool
+
+
+# Name of the setting checked by the policies to bypass RLS
+BYPASS_RLS_SETTING = "rls.bypass_rls"
+
+
+# Context values serialized as arrays
+_ARRAY_VALUE_TYPES = (list, tuple, set, frozenset)
+
+
+def _serialize_value(value: Any) -> Optional[str]:
+    """
+    Serializes a context value to the text of its setting, lists, tuples and
+    sets to an array literal such as `{1,2,3}`.
+    """
+    if value is None:
+        return None
+    if isinstance(value, _ARRAY_VALUE_TYPES):
+        return "{%s}" % ",".join(_serialize_array_element(item) for item in value)
+    return str(value)
+
+
+def _serialize_array_element(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, _ARRAY_VALUE_TYPES):
+        return _serialize_value(value) or ""
+    if isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+    return str(value)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_set_config_statement(
+    keys: Tuple[str, ...], is_local: bool, bypass_role: bool = False
+) -> TextClause:
+    """
+    A single `SELECT set_config(...)` statement applying every key and the
+    bypass flag, or the role with a bypass role, the values are bound
+    parameters so it is the same for every context of a model.
+    """
+    set_configs = [
+        f"set_config('rls.{key}', :{key}, {str(is_local).lower()})" for key in keys
+    ]
+    # The bypass flag and the role are always scoped to the transaction
+    if bypass_role:
+        set_configs.append("set_config('role', :bypass_role, true)")
+    else:
+        set_configs.append(f"set_config('{BYPASS_RLS_SETTING}', :bypass_rls, true)")
+    return text(f"SELECT {', '.join(set_configs)}")
+
+
+def _compile_context(
+    context: Optional[BaseModel],
+    context_mode: ContextMode,
+    bypass: bool,
+    bypass_role: Optional[str] = None,
+) -> CompiledContext:
+    values = context.model_dump() if context is not None else {}
+    params = {key: _serialize_value(value) for key, value in values.items()}
+    session_values: ContextValues = frozenset()
+    if context_mode != ContextMode.set_config_local:
+        session_values = frozenset(
+            (f"rls.{key}", value) for key, value in params.items()
+        )
+    settings = frozenset(name for name, _ in session_values)
+
+    if context_mode == ContextMode.set:
+        statements = []
+        for key, value in values.items():
+            if isinstance(value, _ARRAY_VALUE_TYPES):
+                value = "'%s'" % str(params[key]).replace("'", "''")
+            statements.append(text(f"SET rls.{key} = {value};"))
+        if bypass_role is not None:
+            role = bypass_role if bypass else "NONE"
+            statements.append(text(f"SET LOCAL ROLE {role};"))
+        else:
+            statements.append(
+                text(f"SET LOCAL {BYPASS_RLS_SETTING} = {str(bypass).lower()};")
+            )
+        return CompiledContext(statements, {}, settings, session_values, bypass)
+
+    statement = _get_set_config_statement(
+        tuple(values),
+        context_mode == ContextMode.set_config_local,
+        bypass_role is not None,
+    )
+    if bypass_role is not None:
+        # `none` switches back to the session user
+        params["bypass_role"] = bypass_role if bypass else "none"
+    else:
+        params["bypass_rls"] = str(bypass).lower()
+    return CompiledContext([statement], params, settings, session_values, bypass)
+
+
+_compile_hashable_context = functools.lru_cache(maxsize=1024)(_compile_context)
+
+
+def compile_context(
+    context: Optional[BaseModel],
+    context_mode: ContextMode,
+    bypass: bool = False,
+    bypass_role: Optional[str] = None,
+) -> CompiledContext:
+    """
+    Compiles the statements applying a context and the bypass flag. With a
+    `bypass_role`, bypassing switches to that role instead of setting the flag.
+    Hashable contexts, such as frozen pydantic models, are compiled once and
+    shared by every session.
+    """
+    if bypass_role is not None:
+        bypass_role = normalize_role_name(bypass_role)
+    if isinstance(context, Hashable):
+        try:
+            return _compile_hashable_context(context, context_mode, bypass, bypass_role)
+        except TypeError:  # frozen model with unhashable field values
+            pass
+    return _compile_context(context, context_mode, bypass, bypass_role)
+
+
+def apply_context(
+    connection: Connection, compiled_context: CompiledContext, pipeline: bool = False
+) -> None:
+    """
+    Executes the statements of a compiled context on a connection. With
+    `pipeline` and a sync psycopg (3) connection they are sent in the same
+    network flight as the next statement instead, using the pipeline mode.
+
+    On a `TenantAffinityPool` connection on which the same context was
+    committed, applying it at the start of a transaction is skipped.
+    """
+    if (
+        isinstance(connection.engine.pool, TenantAffinityPool)
+        and compiled_context.session_values
+    ):
+        if _context_is_set(connection, compiled_context):
+            return
+        _listen_transaction_events(connection.engine)
+        connection.info[_PENDING_CONTEXT_INFO_KEY] = compiled_context.session_values
+
+    if pipeline and _supports_pipeline(connection):
+        _listen_pipeline_events(connection.engine)
+        _listen_transaction_events(connection.engine)
+        connection.info[_PIPELINED_CONTEXT_INFO_KEY] = compiled_context
+    else:
+        for stmt in compiled_context.statements:
+            connection.execute(stmt, compiled_context.params)
+    if compiled_context.settings:
+        # Remember the session level settings left on the connection so
+        # `reset_rls_settings_on_checkin` can clear them.
+        connection.info.setdefault(_RLS_SETTINGS_INFO_KEY, set()).update(
+            compiled_context.settings
+        )
+
+
+@contextlib.contextmanager
+def rls_connection(
+    engine: Engine,
+    context: Optional[BaseModel],
+    context_mode: ContextMode = ContextMode.set_config_local,
+    bypass: bool = False,
+    pipeline: bool = False,
+    bypass_role: Optional[str] = None,
+) -> Iterator[Connection]:
+    """
+    Begins a transaction on a new connection with the context applied, for Core
+    workloads that do not need an ORM session. The transaction is committed at
+    the end of the block, or rolled back if it raises.
+    Usage: with rls_connection(engine, context) as connection:
+    """
+    with engine.begin() as connection:
+        apply_context(
+            connection,
+            compile_context(context, context_mode, bypass, bypass_role),
+            pipeline,
+        )
+        yield connection
+
+
+# Keys of the connection info holding the compiled context waiting to be sent
+# with the next statement, and the psycopg pipeline sending them
+_PIPELINED_CONTEXT_INFO_KEY = "rls_pipelined_context"
+_PIPELINE_INFO_KEY = "rls_pipeline"
+# Key of the connection info holding the context values set in the current
+# transaction, see `TenantAffinityPool`
+_PENDING_CONTEXT_INFO_KEY = "rls_pending_context"
+
+
+def _context_is_set(connection: Connection, compiled_context: CompiledContext) -> bool:
+    """
+    Whether the context values were committed on the connection and nothing
+    was applied yet in the current transaction. The bypass flag is scoped to
+    the transaction, so it is never set at that point.
+    """
+    if _PENDING_CONTEXT_INFO_KEY in connection.info or compiled_context.bypass:
+        return False
+    context_values = connection.info.get(_RLS_CONTEXT_INFO_KEY)
+    if context_values != compiled_context.session_values:
+        return False
+    connection.info[_PENDING_CONTEXT_INFO_KEY] = context_values
+    return True
+
+
+def _supports_pipeline(connection: Connection) -> bool:
+    return connection.dialect.driver == "psycopg" and not connection.dialect.is_async
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_for_dialect(stmt: TextClause, dialect: Dialect) -> Compiled:
+    return stmt.compile(dialect=dialect)
+
+
+def _listen_pipeline_events(engine: Engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _send_pipelined_context):
+        event.listen(engine, "before_cursor_execute", _send_pipelined_context)
+        event.listen(engine, "after_cursor_execute", _sync_pipeline)
+        event.listen(engine, "handle_error", _close_pipeline_on_error)
+
+
+def _send_pipelined_context(conn, cursor, statement, parameters, context, executemany):
+    """
+    Queues the context statements before the statement about to be executed,
+    in a pipeline synced by `_sync_pipeline` once that statement is queued.
+    """
+    compiled_context = conn.info.pop(_PIPELINED_CONTEXT_INFO_KEY, None)
+    if compiled_context is None:
+        return
+
+    driver_connection = conn.connection.driver_connection
+    # Server side cursors can not be used in a pipeline
+    if not context._is_server_side:
+        pipeline = driver_connection.pipeline()
+        pipeline.__enter__()
+        conn.info[_PIPELINE_INFO_KEY] = pipeline
+
+    with driver_connection.cursor() as context_cursor:
+        for stmt in compiled_context.statements:
+            compiled = _compile_for_dialect(stmt, conn.dialect)
+            context_cursor.execute(
+                str(compiled), compiled.construct_params(compiled_context.params)
+            )
+
+
+def _sync_pipeline(conn, cursor, statement, parameters, context, executemany):
+    pipeline = conn.info.pop(_PIPELINE_INFO_KEY, None)
+    if pipeline is not None:
+        # Sends the queued statements and fetches their results
+        pipeline.__exit__(None, None, None)
+
+
+def _close_pipeline_on_error(exception_context):
+    connection = exception_context.connection
+    pipeline = connection.info.pop(_PIPELINE_INFO_KEY, None) if connection else None
+    if pipeline is not None:
+        exc = exception_context.original_exception
+        pipeline.__exit__(type(exc), exc, exc.__traceback__)
+
+
+def _listen_transaction_events(engine: Engine) -> None:
+    if not event.contains(engine, "commit", _on_commit):
+        event.listen(engine, "commit", _on_commit)
+        event.listen(engine, "rollback", _on_rollback)
+        event.listen(engine, "rollback_savepoint", _on_rollback_savepoint)
+
+
+def _on_commit(conn):
+    # A context never sent does not outlive its transaction
+    unsent_context = conn.info.pop(_PIPELINED_CONTEXT_INFO_KEY, None)
+    context_values = conn.info.pop(_PENDING_CONTEXT_INFO_KEY, None)
+    if context_values is not None and unsent_context is None:
+        conn.info[_RLS_CONTEXT_INFO_KEY] = context_values
+
+
+def _on_rollback(conn):
+    # Rolling back also reverts the session level settings
+    conn.info.pop(_PIPELINED_CONTEXT_INFO_KEY, None)
+    conn.info.pop(_PENDING_CONTEXT_INFO_KEY, None)
+
+
+def _on_rollback_savepoint(conn, name, context):
+    # The settings made inside the savepoint are reverted, but which values
+    # were applied before it is not tracked, so the connection is no longer
+    # considered primed for any context
+    conn.info.pop(_PENDING_CONTEXT_INFO_KEY, None)
+    conn.info.pop(_RLS_CONTEXT_INFO_KEY, None)
+
+
+def reset_rls_settings_on_checkin(engine: Engine) -> None:
+    """
+    Clears the session level `rls.*` settings applied by an `RlsSession` when
+    its connection is returned to the pool, leaving any other setting intact.
+    Not needed with `ContextMode.set_config_local`.
+    """
+    event.listen(engine, "checkin", _reset_rls_settings)
+
+
+def _reset_rls_settings(dbapi_connection, connection_record):
+    settings = connection_record.info.pop(_RLS_SETTINGS_INFO_KEY, None)
+    connection_record.info.pop(_RLS_CONTEXT_INFO_KEY, None)
+    if dbapi_connection is None or not settings:
+        return
+
+    resets = ", ".join(
+        f"set_config('{name}', NULL, false)" for name in sorted(settings)
+    )
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"SELECT {resets}")
+    finally:
+        cursor.close()
+    dbapi_connection.commit()
+
+
+# The context applied by `register_rls_context` to every new transaction
+rls_context: contextvars.ContextVar[Optional[BaseModel]] = contextvars.ContextVar(
+    "rls_context", default=None
+)
+
+
+@contextlib.contextmanager
+def use_rls_context(context: Optional[BaseModel]):
+    """
+    Sets `rls_context` for the duration of the block.
+    Usage: with use_rls_context(context):
+    """
+    token = rls_context.set(context)
+    try:
+        yield context
+    finally:
+        rls_context.reset(token)
+
+
+def register_rls_context(
+    engine: Engine,
+    context_mode: ContextMode = ContextMode.set_config_local,
+    pipeline: bool = False,
+) -> None:
+    """
+    Applies the context set in `rls_context` once, when a transaction begins on
+    any connection of the engine. This covers plain `Session`s and Core
+    `Connection`s alike, without any per statement overhead.
+    """
+
+    def apply_rls_context(connection: Connection):
+        context = rls_context.get()
+        if context is not None:
+            apply_context(connection, compile_context(context, context_mode), pipeline)
+
+    event.listen(engine, "begin", apply_rls_context)
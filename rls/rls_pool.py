@@ -0,0 +1,75 @@
+import contextlib
+import contextvars
+from typing import FrozenSet, Optional, Tuple, cast
+
+from sqlalchemy.pool import ConnectionPoolEntry, QueuePool
+from sqlalchemy.util.queue import Queue
+
+# Session level settings and their values, as compiled in
+# `CompiledContext.session_values`
+ContextValues = FrozenSet[Tuple[str, Optional[str]]]
+
+# Key of the connection info holding the context values committed on it
+_RLS_CONTEXT_INFO_KEY = "rls_context"
+
+# The context values the next checkout should preferably have
+_preferred_context: contextvars.ContextVar[Optional[ContextValues]] = (
+    contextvars.ContextVar("rls_preferred_context", default=None)
+)
+
+
+class TenantAffinityPool(QueuePool):
+    """
+    `QueuePool` handing out, when it can, a connection on which the requested
+    context is already set, so applying it again can be skipped. Only the
+    session level context modes leave the context on the connection.
+
+    `hits` and `misses` count the checkouts which did or did not find such a
+    connection, a low hit rate under a steady set of tenants means the pool is
+    too small for them.
+    Usage: create_engine(url, poolclass=TenantAffinityPool)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hits = 0
+        self.misses = 0
+
+    @contextlib.contextmanager
+    def prefer(self, context_values: ContextValues):
+        """
+        Prefers connections with `context_values` set for the checkouts made in
+        the block.
+        """
+        token = _preferred_context.set(context_values)
+        try:
+            yield
+        finally:
+            _preferred_context.reset(token)
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        context_values = _preferred_context.get()
+        if context_values is None:
+            return super()._do_get()
+
+        record = self._get_with_context(context_values)
+        if record is not None:
+            self.hits += 1
+            return record
+        self.misses += 1
+        return super()._do_get()
+
+    def _get_with_context(
+        self, context_values: ContextValues
+    ) -> Optional[ConnectionPoolEntry]:
+        queue = cast(Queue[ConnectionPoolEntry], self._pool)
+        with queue.mutex:
+            for record in queue.queue:
+                if record.info.get(_RLS_CONTEXT_INFO_KEY) == context_values:
+                    queue.queue.remove(record)
+                    queue.not_full.notify()
+                    return record
+        return None
+
+    def status(self) -> str:
+        return f"{super().status()} Context hits: {self.hits} Context misses: {self.misses}"
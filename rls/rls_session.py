@@ -1,16 +1,48 @@
-from typing import Optional
+from typing import Dict, Optional
 
 from pydantic import BaseModel
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy import Connection, event
+from sqlalchemy.orm import Session, SessionTransaction
+
+from rls.rls_context import (
+    CompiledContext,
+    ContextMode,
+    apply_context,
+    compile_context,
+    reset_rls_settings_on_checkin,
+)
+from rls.rls_pool import TenantAffinityPool
+from rls.schemas import normalize_role_name
+
+__all__ = ["ContextMode", "RlsSession", "reset_rls_settings_on_checkin"]
 
 
 class RlsSession(Session):
-    def __init__(self, context: Optional[BaseModel] = None, *args, **kwargs):
+    def __init__(
+        self,
+        context: Optional[BaseModel] = None,
+        *args,
+        context_mode: ContextMode = ContextMode.set_config,
+        pipeline: bool = False,
+        bypass_role: Optional[str] = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self._rls_bypass = False  # Track RLS bypass state
-        if context is not None:
-            self.context = context
+        # The bypass flag applied with the context in the current transaction,
+        # None until applied. Applied by the `after_begin` event and reset by
+        # the `after_transaction_end` event.
+        self._rls_applied_bypass: Optional[bool] = None
+        # Compiled contexts by bypass flag, reset by `set_context`
+        self._rls_compiled_contexts: Dict[bool, CompiledContext] = {}
+        self.context_mode = ContextMode(context_mode)
+        # Send the context with the next statement, see `apply_context`
+        self.pipeline = pipeline
+        # Role bypassing RLS, when the policies use one, see `register_rls`
+        self.bypass_role = (
+            normalize_role_name(bypass_role) if bypass_role is not None else None
+        )
+        self.context = context
 
     def bypass_rls(self):
         """
@@ -19,34 +51,68 @@ class RlsSession(Session):
         """
         return self.BypassRLSContext(self)
 
+    def _get_compiled_context(self) -> CompiledContext:
+        """
+        Returns the statements applying the context and the bypass flag,
+        compiled once per context and reused until `set_context` is called.
+        """
+        compiled_context = self._rls_compiled_contexts.get(self._rls_bypass)
+        if compiled_context is None:
+            compiled_context = self._rls_compiled_contexts[self._rls_bypass] = (
+                compile_context(
+                    self.context, self.context_mode, self._rls_bypass, self.bypass_role
+                )
+            )
+        return compiled_context
+
     def _get_set_statements(self):
         """
-        Generates SQL SET statements based on the context model.
+        Generates the SQL statements applying the context model.
         """
-        stmts = []
-        if self.context is None or self._rls_bypass:  # Skip RLS statements if bypassed
-            return None
+        return self._get_compiled_context().statements
 
-        for key, value in self.context.model_dump().items():
-            stmt = text(f"SET rls.{key} = {value};")
-            stmts.append(stmt)
-        return stmts
+    def _apply_context(self, connection: Connection):
+        """
+        Applies the context and the bypass flag to the connection of the
+        current transaction.
+        """
+        # A session without context only needs the bypass flag, when set
+        if self.context is not None or self._rls_bypass or self._rls_applied_bypass:
+            apply_context(connection, self._get_compiled_context(), self.pipeline)
+        self._rls_applied_bypass = self._rls_bypass
 
     def _execute_set_statements(self):
         """
-        Executes the RLS SET statements unless bypassing RLS.
+        Executes the RLS SET statements, along with the bypass flag, unless
+        they were already applied in the current transaction.
         """
-        if self._rls_bypass:  # Skip setting RLS when bypassing
+        if self._rls_applied_bypass == self._rls_bypass:
             return
-        stmts = self._get_set_statements()
-        if stmts is not None:
-            for stmt in stmts:
-                super().execute(stmt)
+        # Beginning a new transaction applies the context on `after_begin`
+        connection = self.connection()
+        if self._rls_applied_bypass != self._rls_bypass:
+            self._apply_context(connection)
+
+    def _connection_for_bind(self, engine, execution_options=None, **kw):
+        """
+        Prefers a pooled connection on which the context is already set when
+        the engine uses a `TenantAffinityPool`.
+        """
+        pool = getattr(engine, "pool", None)
+        if isinstance(pool, TenantAffinityPool):
+            context_values = self._get_compiled_context().session_values
+            if context_values:
+                with pool.prefer(context_values):
+                    return super()._connection_for_bind(engine, execution_options, **kw)
+        return super()._connection_for_bind(engine, execution_options, **kw)
 
     def get_context(self):
         return self.context
 
     def set_context(self, context):
+        if context != self.context:
+            self._rls_applied_bypass = None
+            self._rls_compiled_contexts = {}
         self.context = context
 
     def execute(self, *args, **kwargs):
@@ -56,33 +122,87 @@ class RlsSession(Session):
         self._execute_set_statements()
         return super().execute(*args, **kwargs)
 
+    def stream_batches(self, statement, batch_size: int = 1000, **kwargs):
+        """
+        Executes a statement on a server side cursor and yields its rows in
+        lists of `batch_size`, so memory stays flat however many rows there
+        are. The context is applied once, when the transaction begins.
+        Usage: for rows in session.stream_batches(select(Item)):
+        """
+        result = self.execute(
+            statement,
+            execution_options={"yield_per": batch_size},
+            **kwargs,
+        )
+        with result:
+            yield from result.partitions()
+
     # Inner class for the context manager
-    # Updated BypassRLSContext to handle errors
     class BypassRLSContext:
         def __init__(self, session: "RlsSession"):
             self.session = session
+            self.previous_bypass = False
+            self.savepoint: Optional[SessionTransaction] = None
 
         def __enter__(self):
             """
-            When entering the context, attempt to bypass RLS.
-            If the command fails, rollback the transaction.
+            When entering the context, bypass RLS. The flag is sent along with
+            the context by the next statement, so no extra round trip is made.
+            Inside a transaction the block runs in a savepoint, so a failure
+            only rolls back the work done while bypassing.
             """
+            self.previous_bypass = self.session._rls_bypass
+            if self.session.in_transaction():
+                self.savepoint = self.session.begin_nested()
             self.session._rls_bypass = True
-            # Disable row-level security
-            self.session.execute(text("SET LOCAL rls.bypass_rls = true;"))
             return self.session
 
         def __exit__(self, exc_type, exc_val, exc_tb):
             """
-            When exiting the context, restore RLS if it was successfully disabled.
+            When exiting the context, restore the previous bypass state. It is
+            applied right away when a transaction is still open, so statements
+            run on `session.connection()` do not keep bypassing RLS.
             """
-            self.session._rls_bypass = False
+            self.session._rls_bypass = self.previous_bypass
 
-            # If the transaction failed, skip re-enabling RLS
-            if exc_type is not None:
+            if self.savepoint is not None:
+                # The block may have committed or rolled back the transaction
+                if self.savepoint.is_active:
+                    if exc_type is not None:
+                        self.savepoint.rollback()
+                    else:
+                        self.savepoint.commit()
+            elif exc_type is not None:
                 self.session.rollback()
-                return
-            self.session.execute(text("SET LOCAL rls.bypass_rls = false;"))
+
+            if self.session.in_transaction():
+                self.session._execute_set_statements()
 
         def execute(self, *args, **kwargs):
             return self.session.execute(*args, **kwargs)
+
+
+@event.listens_for(RlsSession, "after_begin")
+def _apply_context_on_begin(session, transaction, connection):
+    """
+    Applies the context once when a transaction begins, so every statement of
+    the transaction has it, including ORM flushes and lazy loads.
+    """
+    # Savepoints see the settings of the enclosing transaction
+    if not transaction.nested:
+        session._apply_context(connection)
+
+
+@event.listens_for(RlsSession, "before_flush")
+def _apply_context_before_flush(session, flush_context, instances):
+    """Applies a context or bypass state changed since the transaction began."""
+    session._execute_set_statements()
+
+
+@event.listens_for(RlsSession, "after_transaction_end")
+def _reset_applied_context_on_end(session, transaction):
+    """
+    The next transaction may use another connection, and rolling back a
+    savepoint also reverts the settings made inside it.
+    """
+    session._rls_applied_bypass = None
@@ -1,12 +1,22 @@
 import abc
-from typing import Any, Optional
+import itertools
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Union
 
 from fastapi import Request
 from pydantic import BaseModel
+from sqlalchemy import Engine
 from sqlalchemy.orm import sessionmaker as SessionMaker
+from sqlalchemy.pool import QueuePool
 
 from rls.rls_session import RlsSession
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+    from sqlalchemy.ext.asyncio import async_sessionmaker as AsyncSessionMaker
+
+    from rls.async_rls_session import AsyncRlsSession
+
 
 class ContextGetter(abc.ABC):
     @abc.abstractmethod
@@ -15,35 +25,118 @@ class ContextGetter(abc.ABC):
         pass
 
 
+class ReplicaStrategy(str, Enum):
+    # each replica in turn
+    round_robin = "ROUND_ROBIN"
+    # the replica with the fewest connections checked out of its pool
+    least_connections = "LEAST_CONNECTIONS"
+
+
+def _get_checked_out_connections(engine: Union[Engine, "AsyncEngine"]) -> int:
+    # Only queue pools keep count of their connections
+    pool = engine.pool
+    return pool.checkedout() if isinstance(pool, QueuePool) else 0
+
+
 class RlsSessioner:
-    def __init__(self, sessionmaker: SessionMaker, context_getter: ContextGetter):
-        if not issubclass(sessionmaker.class_, RlsSession):
+    def __init__(
+        self,
+        sessionmaker: Union[SessionMaker, "AsyncSessionMaker"],
+        context_getter: ContextGetter,
+        replicas: Optional[List[Union[Engine, "AsyncEngine"]]] = None,
+        replica_strategy: ReplicaStrategy = ReplicaStrategy.round_robin,
+    ):
+        # `async_sessionmaker` classes proxy a sync session class, which
+        # avoids importing the asyncio extension for sync only users.
+        session_class = getattr(
+            sessionmaker.class_, "sync_session_class", sessionmaker.class_
+        )
+        if not issubclass(session_class, RlsSession):
             raise ValueError(
-                "sessionmaker class must be RlsSession or a subclass of RlsSession"
+                "sessionmaker class must be RlsSession, AsyncRlsSession or a subclass of them"
             )
 
-        self.session_maker: SessionMaker[RlsSession] = sessionmaker
+        self.session_maker: Union[
+            SessionMaker[RlsSession], "AsyncSessionMaker[AsyncRlsSession]"
+        ] = sessionmaker
         self.context_getter: ContextGetter = context_getter
+        # Engines the read only sessions are bound to, the sessionmaker bind
+        # being the primary
+        self.replicas = list(replicas or [])
+        self.replica_strategy = ReplicaStrategy(replica_strategy)
+        self._replica_counter = itertools.count()
+        self._fastapi_dependency: Optional[Callable] = None
+
+    @property
+    def is_async(self) -> bool:
+        """Whether the sessions are `AsyncRlsSession`s."""
+        return hasattr(self.session_maker.class_, "sync_session_class")
+
+    def _get_replica(self) -> Union[Engine, "AsyncEngine"]:
+        if self.replica_strategy == ReplicaStrategy.least_connections:
+            return min(self.replicas, key=_get_checked_out_connections)
+        # `next` on `itertools.count` is atomic, so this is thread safe
+        return self.replicas[next(self._replica_counter) % len(self.replicas)]
 
     def __call__(
-        self, *args: Optional[Any], **kwargs: Optional[Any]
+        self, *args: Optional[Any], read_only: bool = False, **kwargs: Optional[Any]
     ):  # Get context from the context getter
         context = self.context_getter.get_context(*args, **kwargs)
-        session = self.session_maker(context=context)
-        try:
-            return session
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
+        # The caller owns the session, use it as a (async) context manager to
+        # close it.
+        if read_only and self.replicas:
+            # The session is bound to a replica with the same context
+            return self.session_maker(context=context, bind=self._get_replica())
+        return self.session_maker(context=context)
 
 
 # For Fastapi
 
+# Methods of the requests whose sessions are routed to the replicas
+_READ_ONLY_METHODS = ("GET", "HEAD")
+
 
 def fastapi_dependency_function(RlsSessioner: RlsSessioner):
-    def dependency_function(request: Request):
-        return RlsSessioner(request=request)
+    """
+    Returns a request scoped FastAPI dependency yielding one session per
+    request, which is committed after the endpoint ran (or rolled back if it
+    raised) and then closed to return its connection to the pool.
+
+    The same dependency is returned for the same sessioner, so FastAPI resolves
+    it once per request even when several dependencies depend on it. When the
+    sessioner has replicas, the sessions of GET and HEAD requests are read
+    only and bound to one of them.
+    """
+    if RlsSessioner._fastapi_dependency is not None:
+        return RlsSessioner._fastapi_dependency
+
+    if RlsSessioner.is_async:
+
+        async def async_dependency_function(request: Request):
+            async with RlsSessioner(
+                request=request, read_only=request.method in _READ_ONLY_METHODS
+            ) as session:
+                try:
+                    yield session
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    raise
+
+        RlsSessioner._fastapi_dependency = async_dependency_function
+    else:
+
+        def dependency_function(request: Request):
+            with RlsSessioner(
+                request=request, read_only=request.method in _READ_ONLY_METHODS
+            ) as session:
+                try:
+                    yield session
+                    session.commit()
+                except Exception:
+                    session.rollback()
+                    raise
+
+        RlsSessioner._fastapi_dependency = dependency_function
 
-    return dependency_function
+    return RlsSessioner._fastapi_dependency
@@ -1,14 +1,65 @@
 import inspect
+import re
 from enum import Enum
-from typing import Callable, List, Literal, Optional, Type, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 from pydantic import BaseModel
-from sqlalchemy import Boolean
+from sqlalchemy import Boolean, TextClause, column, select
+from sqlalchemy.dialects.postgresql.base import PGDialect
 from sqlalchemy.sql import func, sqltypes
 from sqlalchemy.sql.elements import (
     ClauseElement,
+    ColumnClause,
 )
 
+# Renders the postgres types, such as `INTEGER[]`, without the percent signs
+# doubling of the drivers paramstyle
+_POLICY_DIALECT = PGDialect(paramstyle="named")
+
+# A template column as compiled, see `template_column`
+_TEMPLATE_COLUMN_PATTERN = re.compile(r'"\{(\w+)\}"')
+
+
+def normalize_roles(roles: Optional[List[str]]) -> List[str]:
+    """
+    The roles of a policy as `pg_policies` lists them: lowercased, as they are
+    not quoted, and `public` when not set.
+    """
+    return sorted(role.lower() for role in roles or ["public"])
+
+
+_ROLE_NAME_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_$]*")
+
+
+def normalize_role_name(role: str) -> str:
+    """
+    The name of a role as postgres folds it when it is not quoted, as in the
+    `TO` clause of the policies and `SET ROLE`, so it can be compared with
+    `CURRENT_USER` and passed to `set_config('role', ...)` too.
+    """
+    if not _ROLE_NAME_PATTERN.fullmatch(role):
+        raise ValueError(f"Role `{role}` is not a valid unquoted identifier")
+    return role.lower()
+
+
+def template_column(name: str) -> ColumnClause:
+    """
+    A column of a policy template, named for each table with `Policy.bind`.
+    Usage: custom_expr=lambda x: template_column("tenant") == x
+    """
+    return column("{%s}" % name)
+
 
 class Command(str, Enum):
     # policies: https://www.postgresql.org/docs/current/sql-createpolicy.html
@@ -21,7 +72,18 @@ class Command(str, Enum):
 
 class ConditionArg(BaseModel):
     comparator_name: str
-    type: Type[sqltypes.TypeEngine]
+    # A type or an instance, e.g. `ARRAY(Integer)` for a list of values
+    type: Union[Type[sqltypes.TypeEngine], sqltypes.TypeEngine]
+    # Passes array args as `ANY(<array>)`, so `column == x` compiles to
+    # `column = ANY(<array>)`, instead of the array itself
+    match_any: bool = True
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def is_array(self) -> bool:
+        return isinstance(sqltypes.to_instance(self.type), sqltypes.ARRAY)
 
 
 class Policy(BaseModel):
@@ -30,16 +92,64 @@ class Policy(BaseModel):
     cmd: Union[Command, List[Command]]
     custom_expr: Optional[Callable[..., ClauseElement]] = None
     custom_policy_name: Optional[str] = None
+    # Roles the policy applies to, every role when not set
+    roles: Optional[List[str]] = None
+    # Wraps the condition args in scalar subqueries the planner evaluates once
+    # per statement, as an InitPlan, instead of once per row
+    initplan: bool = True
+    # Names of the template columns, see `bind`
+    template_columns: Dict[str, str] = {}
 
     __policy_names: List[str] = []
     __compiled_custom_expr: Optional[ClauseElement] = None
     __expr: str = ""
     __policy_suffix: str = ""
     __condition_args_prefix: str = "rls"
+    __accessor_functions: bool = False
+    # The expression, policy names and statements compiled by
+    # `get_sql_policies` for each of its arguments
+    __compiled_policies: Dict[
+        Tuple[str, str, Optional[str], bool], Tuple[str, List[str], List[TextClause]]
+    ] = {}
+    # The expression compiled with the template columns left as placeholders,
+    # shared with the policies `bind` returns, for each `accessor_functions`
+    __compiled_templates: Dict[bool, str] = {}
 
     class Config:
         arbitrary_types_allowed = True
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in type(self).model_fields:
+            # New dicts, copies made by `model_copy()` share the old ones
+            self.__compiled_policies = {}
+            self.__compiled_templates = {}
+
+    def model_copy(
+        self, *, update: Optional[Mapping[str, Any]] = None, deep: bool = False
+    ) -> "Policy":
+        """
+        Copies the policy. `update` does not go through `__setattr__`, so the
+        caches are reset here, except for the compiled template when only the
+        template columns change, see `bind`.
+        """
+        policy = super().model_copy(update=update, deep=deep)
+        policy.__compiled_policies = {}
+        if set(update or {}) - {"template_columns"}:
+            policy.__compiled_templates = {}
+        return policy
+
+    def bind(self, **columns: str) -> "Policy":
+        """
+        Returns a copy of the policy naming its template columns for a table,
+        see `template_column`. The copies share the expression the template is
+        compiled to, so it is compiled once however many tables use it.
+        Usage: __rls_policies__ = [tenant_policy.bind(tenant="owner_id")]
+        """
+        return self.model_copy(
+            update={"template_columns": {**self.template_columns, **columns}}
+        )
+
     @property
     def policy_names(self) -> list[str]:
         """Getter for the private __policy_name field."""
@@ -82,13 +192,28 @@ class Policy(BaseModel):
         """Convert the lambda function to a SQLAlchemy expression."""
         args = []
         for arg in self.condition_args:
-            wrapped_value = func.current_setting(
-                f"{self.__condition_args_prefix}.{arg.comparator_name}", True
-            ).cast(arg.type)
+            if self.__accessor_functions:
+                # `rls.<comparator_name>()`, see `generate_accessor_function`
+                accessor = getattr(func, self.__condition_args_prefix)
+                wrapped_value = getattr(accessor, arg.comparator_name)(type_=arg.type)
+            else:
+                wrapped_value = func.current_setting(
+                    f"{self.__condition_args_prefix}.{arg.comparator_name}", True
+                ).cast(arg.type)
+            if self.initplan:
+                wrapped_value = select(
+                    wrapped_value.label(arg.comparator_name)
+                ).scalar_subquery()
+            if arg.is_array and arg.match_any:
+                # Postgres reads `ANY ((SELECT ...))` as ANY over the rows of a
+                # subquery, casting to the same type keeps it an array
+                wrapped_value = func.any(wrapped_value.cast(arg.type))
             args.append(wrapped_value)
         self.__compiled_custom_expr = self.custom_expr(*args)
         self.__expr = str(
-            self.__compiled_custom_expr.compile(compile_kwargs={"literal_binds": True})
+            self.__compiled_custom_expr.compile(
+                dialect=_POLICY_DIALECT, compile_kwargs={"literal_binds": True}
+            )
         )
 
     def _get_expr_from_custom_expr(self, table_name: str):
@@ -104,13 +229,64 @@ class Policy(BaseModel):
                 f"`custom_expr` must be defined for table `{table_name}`. If you're constructing expressions dynamically, "
             )
 
-    def get_sql_policies(self, table_name: str, name_suffix: str = "0"):
+    def _instantiate_template(self, template: str, table_name: str) -> str:
+        """Replaces the template columns of an expression with their names."""
+
+        def replace(match: re.Match) -> str:
+            name = match.group(1)
+            if name not in self.template_columns:
+                raise ValueError(
+                    f"Template column `{name}` is not bound for table `{table_name}`, "
+                    f"use `policy.bind({name}=...)`"
+                )
+            return _POLICY_DIALECT.identifier_preparer.quote(
+                self.template_columns[name]
+            )
+
+        return _TEMPLATE_COLUMN_PATTERN.sub(replace, template)
+
+    def get_sql_policies(
+        self,
+        table_name: str,
+        name_suffix: str = "0",
+        bypass_role: Optional[str] = None,
+        accessor_functions: bool = False,
+    ) -> List[TextClause]:
+        """
+        Compiles the statements creating the policies on `table_name`, once for
+        each set of arguments until a field of the policy is assigned.
+        """
+        key = (table_name, name_suffix, bypass_role, accessor_functions)
+        compiled = self.__compiled_policies.get(key)
+        if compiled is None:
+            compiled = self.__compiled_policies[key] = self._compile_sql_policies(
+                table_name, name_suffix, bypass_role, accessor_functions
+            )
+        expr, policy_names, policy_lists = compiled
+        self.__expr = expr
+        self.__policy_suffix = name_suffix
+        self.__policy_names = list(policy_names)
+        return list(policy_lists)
+
+    def _compile_sql_policies(
+        self,
+        table_name: str,
+        name_suffix: str,
+        bypass_role: Optional[str],
+        accessor_functions: bool,
+    ) -> Tuple[str, List[str], List[TextClause]]:
         from .utils import generate_rls_policy
 
         commands = [self.cmd] if isinstance(self.cmd, str) else self.cmd
         self.__policy_suffix = name_suffix
+        self.__accessor_functions = accessor_functions
+        self.__policy_names = []
 
-        self._get_expr_from_custom_expr(table_name=table_name)
+        template = self.__compiled_templates.get(accessor_functions)
+        if template is None:
+            self._get_expr_from_custom_expr(table_name=table_name)
+            template = self.__compiled_templates[accessor_functions] = self.__expr
+        self.__expr = self._instantiate_template(template, table_name)
 
         policy_lists = []
 
@@ -137,9 +313,11 @@ class Policy(BaseModel):
                 policy_name=policy_name,
                 table_name=table_name,
                 expr=self.__expr,
+                roles=self.roles,
+                bypass_role=bypass_role,
             )
             policy_lists.append(generated_policy)
-        return policy_lists
+        return self.__expr, self.__policy_names, policy_lists
 
     def __eq__(self, other):
         from .utils import compare_between_policy_sql_expressions
@@ -152,8 +330,9 @@ class Policy(BaseModel):
         expression_check = compare_between_policy_sql_expressions(
             self.expression, other.expression
         )
+        roles_check = normalize_roles(self.roles) == normalize_roles(other.roles)
 
-        return definition_check and cmd_check and expression_check
+        return definition_check and cmd_check and expression_check and roles_check
 
     def __str__(self):
         return f"Policy(definition={self.definition}, cmd={self.cmd}, expression={self.expression})"
@@ -1,28 +1,252 @@
 import re
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import TextClause, text
+from sqlalchemy import MetaData, TextClause, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import sqltypes
 
-from .schemas import Command, Policy
+from .schemas import Command, Policy, normalize_role_name
 
 
 def add_bypass_rls_to_expr(expr: str) -> str:
+    # A scalar subquery is evaluated once per statement, as an InitPlan
     bypass_rls_expr = (
-        "CAST(NULLIF(current_setting('rls.bypass_rls', true), '') AS BOOLEAN) = true"
+        "(SELECT CAST(NULLIF(current_setting('rls.bypass_rls', true), '') "
+        "AS BOOLEAN) AS bypass_rls) = true"
     )
     return f"(({expr}) OR {bypass_rls_expr})"
 
 
+def add_bypass_role_to_expr(expr: str, bypass_role: str) -> str:
+    # Permissive policies are OR'ed with the bypass policy, but restrictive
+    # ones are AND'ed with it so they must let the bypass role through
+    return f"(({expr}) OR (SELECT CURRENT_USER = '{bypass_role}'))"
+
+
+def add_bypass_to_expr(expr: str, definition: str, bypass_role: Optional[str]) -> str:
+    """Adds the bypass check matching the bypass strategy to an expression."""
+    if bypass_role is None:
+        return add_bypass_rls_to_expr(expr)
+    if definition == "RESTRICTIVE":
+        return add_bypass_role_to_expr(expr, bypass_role)
+    return expr
+
+
+def get_bypass_policy_name(table_name: str) -> str:
+    return f"{table_name}_bypass_rls_policy"
+
+
+def generate_bypass_rls_policy(table_name: str, bypass_role: str) -> TextClause:
+    """The policy letting `bypass_role` see and write every row of the table."""
+    return generate_rls_policy(
+        cmd="ALL",
+        definition="PERMISSIVE",
+        policy_name=get_bypass_policy_name(table_name),
+        table_name=table_name,
+        expr="true",
+        roles=[bypass_role],
+        bypass_role=bypass_role,
+    )
+
+
+def get_accessor_function_types(policies: Iterable[Policy]) -> Dict[str, str]:
+    """The SQL type returned by the accessor function of each condition arg."""
+    types: Dict[str, str] = {}
+    for policy in policies:
+        for arg in policy.condition_args or []:
+            type_ = sqltypes.to_instance(arg.type).compile(dialect=postgresql.dialect())
+            if types.setdefault(arg.comparator_name, type_) != type_:
+                raise ValueError(
+                    f"Condition arg `{arg.comparator_name}` is declared as both "
+                    f"{types[arg.comparator_name]} and {type_}"
+                )
+    return types
+
+
+def get_accessor_function_body(name: str, type_: str) -> str:
+    return f"SELECT CAST(current_setting('rls.{name}', true) AS {type_})"
+
+
+def generate_accessor_function(name: str, type_: str) -> List[TextClause]:
+    """
+    Generates the statements creating the `rls.<name>()` function, returning
+    the `rls.<name>` setting cast to `type_`. It is `STABLE PARALLEL SAFE` so
+    the planner can inline it and use it in parallel plans.
+    """
+    return [
+        text("CREATE SCHEMA IF NOT EXISTS rls"),
+        text("GRANT USAGE ON SCHEMA rls TO PUBLIC"),
+        text(f"""
+            CREATE OR REPLACE FUNCTION rls.{name}() RETURNS {type_}
+            LANGUAGE sql STABLE PARALLEL SAFE
+            AS $${get_accessor_function_body(name, type_)}$$
+            """),
+    ]
+
+
+def get_table_policies(
+    table_name: str,
+    policies: List[Policy],
+    bypass_role: Optional[str] = None,
+    accessor_functions: bool = False,
+    consolidate: bool = False,
+) -> List[Policy]:
+    """
+    Compiles the policies of a table to one `Policy` per `CREATE POLICY`, with
+    a single command, its full name as `custom_policy_name` and its expression
+    set, like the policies `check_rls_policies` reads from the database.
+    With `consolidate`, see `consolidate_policies`.
+    """
+    table_policies = []
+    for idx, policy in enumerate(policies):
+        policy.get_sql_policies(
+            table_name=table_name,
+            name_suffix=str(idx),
+            bypass_role=bypass_role,
+            accessor_functions=accessor_functions,
+        )
+        commands = [policy.cmd] if isinstance(policy.cmd, str) else policy.cmd
+        for cmd, policy_name in zip(commands, policy.policy_names):
+            table_policy = Policy(
+                definition=policy.definition,
+                cmd=Command(cmd),
+                custom_policy_name=policy_name,
+                roles=policy.roles,
+            )
+            table_policy.expression = policy.expression
+            table_policies.append(table_policy)
+    if consolidate:
+        table_policies = consolidate_policies(table_name, table_policies)
+    return table_policies
+
+
+def get_metadata_table_policies(metadata: MetaData, table_name: str) -> List[Policy]:
+    """
+    `get_table_policies` of a table, with the options `register_rls` set on
+    `metadata`.
+    """
+    return get_table_policies(
+        table_name,
+        metadata.info.get("rls_policies", {}).get(table_name, []),
+        bypass_role=metadata.info.get("rls_bypass_role"),
+        accessor_functions="rls_accessor_functions" in metadata.info,
+        consolidate=metadata.info.get("rls_consolidate_policies", False),
+    )
+
+
+def consolidate_policies(table_name: str, policies: List[Policy]) -> List[Policy]:
+    """
+    Merges the permissive policies of a table applying to the same roles,
+    which postgres ORs together anyway:
+    - an expression used for SELECT, INSERT, UPDATE and DELETE moves to ALL
+    - the expressions of a command are OR'ed in a single policy
+
+    A command left with a single policy keeps its name, the merged ones are
+    named `<table>_consolidated_<cmd>_policy`. Restrictive policies are kept.
+    """
+    commands = [Command.select, Command.insert, Command.update, Command.delete]
+    by_roles: Dict[Tuple[str, ...], Dict[Command, List[Policy]]] = {}
+    for policy in policies:
+        if policy.definition != "PERMISSIVE":
+            continue
+        by_command = by_roles.setdefault(tuple(policy.roles or ()), {})
+        by_command.setdefault(Command(policy.cmd), []).append(policy)
+
+    consolidated = []
+    for roles, by_command in by_roles.items():
+        # Expressions of every command, an ALL policy only grants them all
+        common = [
+            policy.expression
+            for policy in by_command.get(commands[0], [])
+            if all(
+                any(p.expression == policy.expression for p in by_command.get(cmd, []))
+                for cmd in commands[1:]
+            )
+        ]
+        if common:
+            for cmd in commands:
+                remaining = [p for p in by_command[cmd] if p.expression not in common]
+                if remaining:
+                    by_command[cmd] = remaining
+                else:
+                    del by_command[cmd]
+            all_policies = by_command.setdefault(Command.all, [])
+            for expression in common:
+                hoisted_policy = Policy(definition="PERMISSIVE", cmd=Command.all)
+                hoisted_policy.expression = expression
+                all_policies.append(hoisted_policy)
+
+        roles_prefix = "".join(f"{role}_" for role in roles)
+        for cmd, cmd_policies in by_command.items():
+            expressions = list(dict.fromkeys(p.expression for p in cmd_policies))
+            if len(cmd_policies) == 1 and cmd_policies[0].custom_policy_name:
+                consolidated.append(cmd_policies[0])
+                continue
+            consolidated_policy = Policy(
+                definition="PERMISSIVE",
+                cmd=cmd,
+                custom_policy_name=(
+                    f"{table_name}_{roles_prefix}consolidated_{cmd.value}_policy"
+                ).lower(),
+                roles=list(roles) or None,
+            )
+            consolidated_policy.expression = (
+                expressions[0]
+                if len(expressions) == 1
+                else " OR ".join(f"({expression})" for expression in expressions)
+            )
+            consolidated.append(consolidated_policy)
+
+    return consolidated + [p for p in policies if p.definition != "PERMISSIVE"]
+
+
+def generate_table_policy(
+    table_name: str, policy: Policy, bypass_role: Optional[str] = None
+) -> TextClause:
+    """Generates the statement creating a policy `get_table_policies` compiled."""
+    return generate_rls_policy(
+        cmd=Command(policy.cmd).value,
+        definition=policy.definition,
+        policy_name=str(policy.custom_policy_name),
+        table_name=table_name,
+        expr=policy.expression,
+        roles=policy.roles,
+        bypass_role=bypass_role,
+    )
+
+
 def generate_rls_policy(
-    cmd: str, definition: str, policy_name: str, table_name: str, expr: str
+    cmd: str,
+    definition: str,
+    policy_name: str,
+    table_name: str,
+    expr: str,
+    roles: Optional[List[str]] = None,
+    bypass_role: Optional[str] = None,
+    add_bypass: bool = True,
 ) -> TextClause:
-    if "rls.bypass_rls" not in expr:
-        expr = add_bypass_rls_to_expr(expr)
+    """
+    Generates the statement creating a policy. Without `bypass_role` the policy
+    checks the `rls.bypass_rls` setting, otherwise RLS is bypassed by the
+    policy `generate_bypass_rls_policy` creates for that role. `add_bypass` is
+    False for an expression read from the database, which already has it.
+    """
+    if add_bypass:
+        if bypass_role is not None:
+            expr = add_bypass_to_expr(
+                expr, definition, normalize_role_name(bypass_role)
+            )
+        elif "rls.bypass_rls" not in expr:
+            expr = add_bypass_rls_to_expr(expr)
+
+    to_roles = f"TO {', '.join(roles)}" if roles else ""
 
     if cmd in ["ALL", "SELECT", "DELETE"]:
         return text(f"""
                 CREATE POLICY {policy_name} ON {table_name}
                 AS {definition}
                 FOR {cmd}
+                {to_roles}
                 USING ({expr})
                 """)
 
@@ -32,6 +256,7 @@ def generate_rls_policy(
             CREATE POLICY {policy_name} ON {table_name}
             AS {definition}
             FOR {cmd}
+            {to_roles}
             USING ({expr})
             WITH CHECK ({expr});
         """)
@@ -41,6 +266,7 @@ def generate_rls_policy(
                 CREATE POLICY {policy_name} ON {table_name}
                 AS {definition}
                 FOR {cmd}
+                {to_roles}
                 WITH CHECK ({expr})
                 """)
 
@@ -48,9 +274,13 @@ def generate_rls_policy(
         raise ValueError(f'Unknown policy command"{cmd}"')
 
 
-def policy_changed_checker(db_policy: Policy, metadata_policy: Policy) -> bool:
+def policy_changed_checker(
+    db_policy: Policy, metadata_policy: Policy, bypass_role: Optional[str] = None
+) -> bool:
     temp_metadata_policy = metadata_policy.model_copy()
-    temp_metadata_policy.expression = add_bypass_rls_to_expr(metadata_policy.expression)
+    temp_metadata_policy.expression = add_bypass_to_expr(
+        metadata_policy.expression, metadata_policy.definition, bypass_role
+    )
 
     if isinstance(temp_metadata_policy.cmd, list):
         temp_metadata_policy.cmd = Command(temp_metadata_policy.cmd[0])
@@ -59,6 +59,24 @@ def get_all_users(
     return list(result)
 
 
+def get_nested_session(
+    db: rls_session.RlsSession = demo_sessioner,
+) -> rls_session.RlsSession:
+    return db
+
+
+@app.get("/session_reuse")
+def get_session_reuse(
+    db: rls_session.RlsSession = demo_sessioner,
+    nested_db: rls_session.RlsSession = fastapi.Depends(get_nested_session),
+    account_id: int | None = None,
+) -> bool:
+    del account_id
+    # One session is created per request and shared by every dependency.
+    db.execute(sa.select(models.User.username)).all()
+    return db is nested_db
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,12 +1,12 @@
 import typing
 
 import pydantic
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import ARRAY, Column, ForeignKey, Integer, String
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import column
 
 from rls.register_rls import register_rls
-from rls.schemas import Command, ConditionArg, Permissive
+from rls.schemas import Command, ConditionArg, Permissive, Restrictive
 
 Base: typing.Any = register_rls(declarative_base())
 
@@ -67,5 +67,126 @@ class Item(Base):
     ]
 
 
+# Models whose policies are bypassed by switching to the `rls_bypass` role
+RoleBypassBase: typing.Any = register_rls(declarative_base(), bypass_role="rls_bypass")
+
+
+class TenantRow(RoleBypassBase):
+    __tablename__ = "tenant_rows"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, index=True)
+
+    __rls_policies__ = [
+        Permissive(
+            condition_args=[
+                ConditionArg(comparator_name="account_id", type=Integer),
+            ],
+            cmd=[Command.all],
+            custom_expr=lambda x: column("owner_id") == x,
+            custom_policy_name="eq_accountId",
+        ),
+        Restrictive(
+            condition_args=[
+                ConditionArg(comparator_name="account_id", type=Integer),
+            ],
+            cmd=[Command.select],
+            custom_expr=lambda x: column("owner_id") <= x,
+            custom_policy_name="lte_accountId",
+        ),
+    ]
+
+
+# Models whose policies read the context through `rls.<field>()` functions
+AccessorFunctionsBase: typing.Any = register_rls(
+    declarative_base(), accessor_functions=True
+)
+
+
+class Document(AccessorFunctionsBase):
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, index=True)
+
+    __rls_policies__ = [
+        Permissive(
+            condition_args=[
+                ConditionArg(comparator_name="account_id", type=Integer),
+            ],
+            cmd=[Command.all],
+            custom_expr=lambda x: column("owner_id") == x,
+            custom_policy_name="owner",
+        ),
+    ]
+
+
+# Models whose permissive policies are merged into as few policies as possible
+ConsolidatedBase: typing.Any = register_rls(
+    declarative_base(), consolidate_policies=True
+)
+
+
+class Note(ConsolidatedBase):
+    __tablename__ = "notes"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, index=True)
+    reviewer_id = Column(Integer, index=True)
+
+    __rls_policies__ = [
+        Permissive(
+            condition_args=[
+                ConditionArg(comparator_name="account_id", type=Integer),
+            ],
+            cmd=[Command.select, Command.insert, Command.update, Command.delete],
+            custom_expr=lambda x: column("owner_id") == x,
+            custom_policy_name="owner",
+        ),
+        Permissive(
+            condition_args=[
+                ConditionArg(comparator_name="account_id", type=Integer),
+            ],
+            cmd=[Command.select, Command.update],
+            custom_expr=lambda x: column("reviewer_id") == x,
+            custom_policy_name="reviewer",
+        ),
+        Permissive(
+            condition_args=[
+                ConditionArg(comparator_name="account_id", type=Integer),
+            ],
+            cmd=[Command.select],
+            custom_expr=lambda x: column("id") == x,
+            custom_policy_name="id",
+        ),
+    ]
+
+
+# Models whose policies match a list of accounts
+MembershipBase: typing.Any = register_rls(declarative_base())
+
+
+class Project(MembershipBase):
+    __tablename__ = "projects"
+
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, index=True)
+
+    __rls_policies__ = [
+        Permissive(
+            condition_args=[
+                ConditionArg(comparator_name="account_ids", type=ARRAY(Integer)),
+            ],
+            cmd=[Command.select],
+            custom_expr=lambda x: column("account_id") == x,
+            custom_policy_name="member",
+        ),
+    ]
+
+
 class SampleRlsContext(pydantic.BaseModel):
     account_id: int | None
+
+
+class MembershipRlsContext(pydantic.BaseModel):
+    account_ids: typing.List[int]
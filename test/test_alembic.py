@@ -67,38 +67,38 @@ class TestAlembicOperations(unittest.TestCase):
                     "policyname": "items_smaller_than_or_equal_accountid_policy_all_policy_2",
                     "permissive": "PERMISSIVE",
                     "cmd": "ALL",
-                    "qual": "((owner_id <= (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((owner_id <= ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "items_greater_than_accountid_policy_select_policy_1",
                     "permissive": "PERMISSIVE",
                     "cmd": "SELECT",
-                    "qual": "((owner_id > (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((owner_id > ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "items_equal_to_accountid_policy_update_policy_0",
                     "permissive": "PERMISSIVE",
                     "cmd": "UPDATE",
-                    "qual": "((owner_id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((owner_id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "items_equal_to_accountid_policy_select_policy_0",
                     "permissive": "PERMISSIVE",
                     "cmd": "SELECT",
-                    "qual": "((owner_id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((owner_id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "users_equal_to_accountid_policy_update_policy_0",
                     "permissive": "PERMISSIVE",
                     "cmd": "UPDATE",
-                    "qual": "((id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
-                    "with_check": "((id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
+                    "with_check": "((id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "users_equal_to_accountid_policy_select_policy_0",
                     "permissive": "PERMISSIVE",
                     "cmd": "SELECT",
-                    "qual": "((id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
             ]
 
@@ -0,0 +1,105 @@
+import unittest
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from rls.async_rls_session import AsyncRlsSession
+from rls.rls_context import register_rls_context, use_rls_context
+from rls.rls_session import ContextMode
+from rls.rls_sessioner import ContextGetter, RlsSessioner
+from test import database, models
+
+
+class TestAsyncRLSPolicies(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.instance = database.test_postgres_instance()
+        cls.async_url = cls.instance.non_superadmin_engine.url.set(
+            drivername="postgresql+asyncpg"
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.instance
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(self.async_url)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_rls_query_with_async_rls_session_and_bypass(self):
+        for context_mode in ContextMode:
+            async with AsyncRlsSession(
+                context=models.SampleRlsContext(account_id=1),
+                bind=self.engine,
+                context_mode=context_mode,
+            ) as session:
+                res = (
+                    (await session.execute(text("SELECT * FROM users")))
+                    .mappings()
+                    .fetchall()
+                )
+                self.assertEqual(len(res), 1, "Expected 1 user to be returned.")
+                self.assertEqual(res[0]["id"], 1, "Expected user id to be 1.")
+
+                async with session.bypass_rls():
+                    res = (
+                        await session.execute(text("SELECT * FROM users"))
+                    ).fetchall()
+                    self.assertEqual(len(res), 2, "Expected 2 users to be returned.")
+
+                session.set_context(models.SampleRlsContext(account_id=2))
+                res = (await session.execute(text("SELECT id FROM users"))).scalars()
+                self.assertEqual(list(res), [2], "Expected user id to be 2.")
+
+    async def test_rls_query_with_async_rls_sessioner(self):
+        class ExampleContextGetter(ContextGetter):
+            def get_context(self, *args, **kwargs) -> models.SampleRlsContext:
+                return models.SampleRlsContext(account_id=kwargs.get("account_id"))
+
+        my_sessioner = RlsSessioner(
+            sessionmaker=async_sessionmaker(class_=AsyncRlsSession, bind=self.engine),
+            context_getter=ExampleContextGetter(),
+        )
+
+        async with my_sessioner(account_id=2) as session:
+            res = (await session.execute(text("SELECT id FROM users"))).scalars()
+            self.assertEqual(list(res), [2], "Expected user id to be 2.")
+
+    async def test_stream_batches(self):
+        async with AsyncRlsSession(
+            context=models.SampleRlsContext(account_id=2), bind=self.engine
+        ) as session:
+            batches = [
+                [row.id for row in rows]
+                async for rows in session.stream_batches(
+                    select(models.Item.id).order_by(models.Item.id), batch_size=1
+                )
+            ]
+        self.assertEqual(
+            batches, [[1], [2], [3], [4]], "Expected the items one by one."
+        )
+
+    async def test_register_rls_context(self):
+        register_rls_context(self.engine.sync_engine)
+
+        with use_rls_context(models.SampleRlsContext(account_id=2)):
+            async with AsyncSession(bind=self.engine) as session:
+                res = (await session.execute(select(models.User.id))).scalars()
+                self.assertEqual(list(res), [2], "Expected user id to be 2.")
+
+    def test_rls_sessioner_rejects_plain_async_session(self):
+        with self.assertRaises(ValueError):
+            RlsSessioner(
+                sessionmaker=async_sessionmaker(class_=AsyncSession),
+                context_getter=None,  # type: ignore
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
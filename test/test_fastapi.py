@@ -10,10 +10,11 @@ class FastapiTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         # Manually run the lifespan async generator for the test database setup
-        loop = asyncio.get_event_loop()
-        cls.lifespan = loop.run_until_complete(
-            fastapi_sample.app.router.lifespan_context(fastapi_sample.app).__aenter__()
-        )
+        loop = asyncio.new_event_loop()
+        # Keep a reference to the lifespan, the test database is stopped when
+        # it is garbage collected.
+        cls.lifespan = fastapi_sample.app.router.lifespan_context(fastapi_sample.app)
+        loop.run_until_complete(cls.lifespan.__aenter__())
 
         # Create a TestClient instance
         cls.client = TestClient(fastapi_sample.app)
@@ -32,6 +33,16 @@ class FastapiTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), ["user1", "user2"])
 
+    def test_one_session_per_request(self):
+        response = self.client.get("/session_reuse", params={"account_id": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json(), "Expected dependencies to share a session.")
+        self.assertEqual(
+            fastapi_sample.session_maker.kw["bind"].pool.checkedout(),
+            0,
+            "Expected the connection to be returned to the pool.",
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,50 @@
+import contextlib
 import unittest
+from typing import Optional
 
-from sqlalchemy import text
-from sqlalchemy.orm import sessionmaker
+import psycopg
+from alembic.autogenerate import produce_migrations
+from alembic.autogenerate.api import AutogenContext
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from alembic.operations.ops import CreateIndexOp
+from sqlalchemy import (
+    Engine,
+    Integer,
+    column,
+    create_engine,
+    delete,
+    event,
+    exc,
+    func,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.orm import Session, sessionmaker
 
-from rls.rls_session import RlsSession
-from rls.rls_sessioner import ContextGetter, RlsSessioner
+from rls.alembic_rls import (
+    CreateAccessorFunctionOp,
+    CreatePolicyOp,
+    DropAccessorFunctionOp,
+    DropPolicyOp,
+    check_rls_policies,
+    get_rls_catalog,
+    include_policy_indexes,
+)
+from rls.index_advisor import (
+    MissingIndex,
+    find_missing_policy_indexes,
+    get_policy_columns,
+)
+from rls.policy_overhead import OverheadReport, measure_policy_overhead
+from rls.rls_bulk import insert_by_tenant
+from rls.rls_context import register_rls_context, rls_connection, use_rls_context
+from rls.rls_pool import TenantAffinityPool
+from rls.rls_session import ContextMode, RlsSession, reset_rls_settings_on_checkin
+from rls.rls_sessioner import ContextGetter, ReplicaStrategy, RlsSessioner
+from rls.schemas import Command, ConditionArg, Permissive, template_column
+from rls.utils import generate_rls_policy
 from test import database, models
 
 
@@ -51,38 +91,38 @@ class TestRLSPolicies(unittest.TestCase):
                     "policyname": "items_smaller_than_or_equal_accountid_policy_all_policy_2",
                     "permissive": "PERMISSIVE",
                     "cmd": "ALL",
-                    "qual": "((owner_id <= (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((owner_id <= ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "items_greater_than_accountid_policy_select_policy_1",
                     "permissive": "PERMISSIVE",
                     "cmd": "SELECT",
-                    "qual": "((owner_id > (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((owner_id > ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "items_equal_to_accountid_policy_update_policy_0",
                     "permissive": "PERMISSIVE",
                     "cmd": "UPDATE",
-                    "qual": "((owner_id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((owner_id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "items_equal_to_accountid_policy_select_policy_0",
                     "permissive": "PERMISSIVE",
                     "cmd": "SELECT",
-                    "qual": "((owner_id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((owner_id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "users_equal_to_accountid_policy_update_policy_0",
                     "permissive": "PERMISSIVE",
                     "cmd": "UPDATE",
-                    "qual": "((id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
-                    "with_check": "((id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
+                    "with_check": "((id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
                 {
                     "policyname": "users_equal_to_accountid_policy_select_policy_0",
                     "permissive": "PERMISSIVE",
                     "cmd": "SELECT",
-                    "qual": "((id = (current_setting('rls.account_id'::text, true))::integer) OR ((NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean = true))",
+                    "qual": "((id = ( SELECT (current_setting('rls.account_id'::text, true))::integer AS account_id)) OR (( SELECT (NULLIF(current_setting('rls.bypass_rls'::text, true), ''::text))::boolean AS bypass_rls) = true))",
                 },
             ]
 
@@ -104,6 +144,82 @@ class TestRLSPolicies(unittest.TestCase):
                         f"Expected policy '{policy['policyname']}' to have '{key}'='{value}'.",
                     )
 
+    def test_policy_compilation_is_memoized(self):
+        calls = []
+
+        def owner_expr(x):
+            calls.append(x)
+            return column("owner_id") == x
+
+        policy = Permissive(
+            condition_args=[ConditionArg(comparator_name="account_id", type=Integer)],
+            cmd=[Command.select, Command.update],
+            custom_expr=owner_expr,
+        )
+        first = policy.get_sql_policies(table_name="items", name_suffix="1")
+        second = policy.get_sql_policies(table_name="items", name_suffix="1")
+        self.assertEqual(len(calls), 1, "Expected the policy compiled once.")
+        self.assertEqual([str(stmt) for stmt in first], [str(stmt) for stmt in second])
+        self.assertEqual(
+            policy.policy_names,
+            [
+                "items_permissive_select_policy_1",
+                "items_permissive_update_policy_1",
+            ],
+        )
+
+        # The expression does not depend on the table
+        policy.get_sql_policies(table_name="users", name_suffix="1")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(policy.policy_names), 2)
+
+        # Copies do not clear the cache of the policy they were made from
+        policy_copy = policy.model_copy()
+        policy_copy.cmd = Command.select
+        policy.get_sql_policies(table_name="items", name_suffix="1")
+        self.assertEqual(len(calls), 1)
+
+        policy.custom_expr = lambda x: column("owner_id") > x
+        policy.get_sql_policies(table_name="items", name_suffix="1")
+        self.assertIn(">", policy.expression)
+
+        # Nor do the fields `model_copy` updates
+        policy_copy = policy.model_copy(
+            update={"custom_expr": lambda x: column("owner_id") < x, "initplan": False}
+        )
+        policy_copy.get_sql_policies(table_name="items", name_suffix="1")
+        self.assertIn("<", policy_copy.expression)
+        self.assertNotIn("SELECT", policy_copy.expression)
+        policy.get_sql_policies(table_name="items", name_suffix="1")
+        self.assertIn(">", policy.expression)
+
+    def test_policy_templates(self):
+        calls = []
+
+        def tenant_expr(x):
+            calls.append(x)
+            return template_column("tenant") == x
+
+        tenant_policy = Permissive(
+            condition_args=[ConditionArg(comparator_name="account_id", type=Integer)],
+            cmd=[Command.select],
+            custom_expr=tenant_expr,
+            custom_policy_name="tenant",
+        )
+        items_policy = tenant_policy.bind(tenant="owner_id")
+        users_policy = tenant_policy.bind(tenant="Id")
+
+        items_policy.get_sql_policies(table_name="items")
+        self.assertTrue(items_policy.expression.startswith("owner_id = "))
+        self.assertEqual(items_policy.policy_names, ["items_tenant_select_policy_0"])
+        users_policy.get_sql_policies(table_name="users")
+        self.assertTrue(users_policy.expression.startswith('"Id" = '))
+        self.assertEqual(len(calls), 1, "Expected the template compiled once.")
+        self.assertEqual(get_policy_columns(items_policy, "items"), ["owner_id"])
+
+        with self.assertRaisesRegex(ValueError, "`tenant` is not bound"):
+            tenant_policy.get_sql_policies(table_name="items")
+
     def test_rls_query_with_rls_session_and_bypass(self):
         context = models.SampleRlsContext(account_id=1)
 
@@ -129,6 +245,556 @@ class TestRLSPolicies(unittest.TestCase):
                 )
                 self.assertEqual(len(my_user), 2, "Expected 2 users to be returned.")
 
+    @contextlib.contextmanager
+    def record_statements(self, engine: Optional[Engine] = None):
+        """Records every statement sent by `engine`, the non superadmin one by default."""
+        engine = engine or self.non_superadmin_engine
+        # Make sure dialect initialization queries are not recorded
+        engine.connect().close()
+        statements: list[str] = []
+
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record_statement)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", record_statement)
+
+    def test_rls_query_with_set_config_context_mode(self):
+        context = models.SampleRlsContext(account_id=1)
+
+        with self.record_statements() as statements:
+            with RlsSession(
+                context=context,
+                bind=self.non_superadmin_engine,
+                context_mode=ContextMode.set_config,
+            ) as session:
+                res = session.execute(text("SELECT * FROM users")).mappings().fetchall()
+
+        self.assertEqual(len(res), 1, "Expected 1 user to be returned.")
+        self.assertEqual(res[0]["id"], 1, "Expected user id to be 1.")
+        self.assertEqual(
+            len(statements), 2, "Expected the context to be applied in one statement."
+        )
+        self.assertIn("set_config('rls.account_id'", statements[0])
+
+    def test_context_applied_once_per_transaction(self):
+        context = models.SampleRlsContext(account_id=1)
+        session = RlsSession(
+            context=context,
+            bind=self.non_superadmin_engine,
+            context_mode=ContextMode.set_config,
+        )
+
+        with self.record_statements() as statements:
+            with session.begin():
+                for _ in range(3):
+                    res = session.execute(text("SELECT id FROM users")).scalars().all()
+                    self.assertEqual(res, [1])
+            self.assertEqual(
+                len(statements), 4, "Expected the context to be applied once."
+            )
+
+            with session.begin():
+                session.execute(text("SELECT id FROM users")).scalars().all()
+                session.set_context(models.SampleRlsContext(account_id=1))
+                session.execute(text("SELECT id FROM users")).scalars().all()
+                session.set_context(models.SampleRlsContext(account_id=2))
+                res = session.execute(text("SELECT id FROM users")).scalars().all()
+                self.assertEqual(res, [2], "Expected the new context to be applied.")
+            self.assertEqual(
+                len(statements),
+                9,
+                "Expected the context to be re-applied for a new transaction "
+                "and a different context only.",
+            )
+        session.close()
+
+    def test_compiled_context_is_cached(self):
+        session = RlsSession(
+            context=models.SampleRlsContext(account_id=1),
+            bind=self.non_superadmin_engine,
+            context_mode=ContextMode.set_config,
+        )
+        with self.record_statements() as statements:
+            for account_id in (1, 1, 2):
+                session.set_context(models.SampleRlsContext(account_id=account_id))
+                compiled_context = session._get_compiled_context()
+                with session.begin():
+                    res = session.execute(text("SELECT id FROM users")).scalars()
+                    self.assertEqual(list(res), [account_id])
+                self.assertIs(
+                    session._get_compiled_context(),
+                    compiled_context,
+                    "Expected the compiled context to be reused.",
+                )
+        session.close()
+
+        self.assertEqual(
+            statements[0], statements[2], "Expected a parameterized statement."
+        )
+        self.assertEqual(statements[0], statements[4])
+        self.assertNotIn("1", statements[0])
+
+    def test_compiled_context_is_shared_for_frozen_contexts(self):
+        class FrozenRlsContext(models.SampleRlsContext, frozen=True):
+            pass
+
+        first_session = RlsSession(context=FrozenRlsContext(account_id=1))
+        second_session = RlsSession(context=FrozenRlsContext(account_id=1))
+        self.assertIs(
+            first_session._get_compiled_context(),
+            second_session._get_compiled_context(),
+            "Expected equal frozen contexts to share their compiled context.",
+        )
+
+    def test_context_statement_is_the_same_for_every_tenant(self):
+        def get_compiled_cache_size(context_mode, tenants):
+            engine = create_engine(self.non_superadmin_engine.url)
+            statements = set()
+
+            @event.listens_for(engine, "before_cursor_execute")
+            def record_statement(conn, cursor, statement, *args):
+                statements.add(statement)
+
+            cache_sizes = []
+            for account_id in range(1, tenants + 1):
+                with RlsSession(
+                    context=models.SampleRlsContext(account_id=account_id),
+                    bind=engine,
+                    context_mode=context_mode,
+                ) as session:
+                    session.execute(select(models.User.id)).all()
+                cache_sizes.append(len(engine._compiled_cache))
+            engine.dispose()
+            return len(statements), cache_sizes
+
+        statement_count, cache_sizes = get_compiled_cache_size(
+            ContextMode.set_config, tenants=20
+        )
+        self.assertEqual(statement_count, 2, "Expected one context statement text.")
+        self.assertEqual(
+            cache_sizes, [cache_sizes[0]] * 20, "Expected the cache size to be flat."
+        )
+
+        # SET interpolates the values, one cache entry per tenant
+        statement_count, cache_sizes = get_compiled_cache_size(
+            ContextMode.set, tenants=20
+        )
+        self.assertEqual(statement_count, 22)
+        self.assertEqual(cache_sizes[-1] - cache_sizes[0], 19)
+
+    def test_pipelined_context(self):
+        # The pipeline mode needs psycopg 3, whatever the default driver is
+        engine = create_engine(
+            self.non_superadmin_engine.url.set(drivername="postgresql+psycopg")
+        )
+        for context_mode in ContextMode:
+            session = RlsSession(
+                context=models.SampleRlsContext(account_id=1),
+                bind=engine,
+                context_mode=context_mode,
+                pipeline=True,
+            )
+            with self.record_statements(engine) as statements:
+                with session.begin():
+                    res = session.execute(select(models.User.id)).scalars()
+                    self.assertEqual(list(res), [1], "Expected user id to be 1.")
+                    with session.bypass_rls():
+                        res = session.execute(select(models.User.id)).scalars()
+                        self.assertEqual(list(res), [1, 2])
+                    pgconn = session.connection().connection.driver_connection.pgconn
+                    self.assertEqual(
+                        pgconn.pipeline_status,
+                        psycopg.pq.PipelineStatus.OFF,
+                        "Expected the pipeline to be closed.",
+                    )
+            # The context is sent in the pipeline, not as its own statement
+            self.assertFalse([stmt for stmt in statements if "rls." in stmt])
+
+            with self.assertRaises(exc.DataError):
+                with session.begin():
+                    session.execute(text("SELECT 1 / 0"))
+            res = session.execute(select(models.User.id)).scalars()
+            self.assertEqual(list(res), [1], "Expected the session to be usable.")
+            session.close()
+        engine.dispose()
+
+    def test_bypass_rls_is_applied_with_the_context(self):
+        session = RlsSession(
+            context=models.SampleRlsContext(account_id=1),
+            bind=self.non_superadmin_engine,
+            context_mode=ContextMode.set_config,
+        )
+        with self.record_statements() as statements:
+            with session.bypass_rls():
+                res = session.execute(text("SELECT id FROM users")).scalars()
+                self.assertEqual(list(res), [1, 2], "Expected RLS to be bypassed.")
+            res = session.execute(text("SELECT id FROM users")).scalars()
+            self.assertEqual(list(res), [1], "Expected RLS to be restored.")
+        session.close()
+
+        self.assertEqual(len(statements), 4, "Expected no extra round trip.")
+        self.assertIn("set_config('rls.bypass_rls'", statements[0])
+        self.assertIn("set_config('rls.bypass_rls'", statements[2])
+
+    def test_nested_bypass_rls_uses_savepoints(self):
+        session = RlsSession(
+            context=models.SampleRlsContext(account_id=1),
+            bind=self.non_superadmin_engine,
+            context_mode=ContextMode.set_config,
+        )
+
+        def get_work():
+            return session.execute(text("SELECT id FROM work")).scalars().all()
+
+        def get_users():
+            return session.execute(text("SELECT id FROM users")).scalars().all()
+
+        with session.begin():
+            session.execute(text("CREATE TEMP TABLE work (id int) ON COMMIT DROP"))
+            session.execute(text("INSERT INTO work VALUES (1)"))
+
+            with self.assertRaises(ValueError):
+                with session.bypass_rls():
+                    session.execute(text("INSERT INTO work VALUES (2)"))
+                    with session.bypass_rls():
+                        self.assertEqual(get_users(), [1, 2])
+                    self.assertEqual(get_users(), [1, 2], "Expected to still bypass.")
+                    raise ValueError()
+
+            self.assertEqual(get_work(), [1], "Expected the outer work to be kept.")
+            self.assertEqual(get_users(), [1], "Expected RLS to be restored.")
+
+            with session.bypass_rls():
+                session.execute(text("INSERT INTO work VALUES (3)"))
+            self.assertEqual(get_work(), [1, 3])
+        session.close()
+
+    def test_bypass_rls_is_restored_on_the_connection(self):
+        for context_mode in ContextMode:
+            session = RlsSession(
+                context=models.SampleRlsContext(account_id=1),
+                bind=self.non_superadmin_engine,
+                context_mode=context_mode,
+            )
+            for begin in (contextlib.nullcontext, session.begin):
+                with begin():
+                    with session.bypass_rls():
+                        res = session.execute(select(models.User.id)).scalars()
+                        self.assertEqual(list(res), [1, 2])
+                    res = session.connection().execute(select(models.User.id))
+                    self.assertEqual(
+                        list(res.scalars()), [1], f"Expected RLS with {context_mode}."
+                    )
+                session.rollback()
+            session.close()
+
+    def test_bypass_rls_around_commit_and_rollback(self):
+        session = RlsSession(
+            context=models.SampleRlsContext(account_id=1),
+            bind=self.non_superadmin_engine,
+        )
+
+        def get_users():
+            return session.execute(select(models.User.id)).scalars().all()
+
+        self.assertEqual(get_users(), [1])
+        with session.bypass_rls():
+            self.assertEqual(get_users(), [1, 2])
+            session.commit()
+        self.assertEqual(get_users(), [1], "Expected RLS to be restored.")
+
+        with session.bypass_rls():
+            self.assertEqual(get_users(), [1, 2])
+            session.rollback()
+        self.assertEqual(get_users(), [1], "Expected RLS to be restored.")
+        session.close()
+
+    def test_context_applied_at_transaction_begin(self):
+        with self.record_statements() as statements:
+            with RlsSession(
+                context=models.SampleRlsContext(account_id=1),
+                bind=self.non_superadmin_engine,
+                context_mode=ContextMode.set_config,
+            ) as session:
+                # Core statements on the session connection get the context
+                res = session.connection().execute(select(models.User.id)).scalars()
+                self.assertEqual(list(res), [1], "Expected user id to be 1.")
+                self.assertIn("set_config('rls.account_id'", statements[0])
+
+                self.assertIsNone(session.get(models.User, 2))
+                item = session.get(models.Item, 1)
+                self.assertIsNotNone(item)
+                # Lazy load
+                self.assertEqual(item.owner.id, 1, "Expected owner id to be 1.")
+            self.assertEqual(
+                len([stmt for stmt in statements if "set_config" in stmt]),
+                1,
+                "Expected the context to be applied once.",
+            )
+
+    def test_register_rls_context(self):
+        engine = create_engine(self.non_superadmin_engine.url)
+        register_rls_context(engine)
+        try:
+            with use_rls_context(models.SampleRlsContext(account_id=2)):
+                with Session(bind=engine) as session:
+                    self.assertIsNone(session.get(models.User, 1))
+                    item = session.get(models.Item, 3)
+                    self.assertEqual(item.owner.id, 2, "Expected owner id to be 2.")
+
+                with engine.connect() as connection:
+                    res = connection.execute(select(models.User.id)).scalars()
+                    self.assertEqual(list(res), [2], "Expected user id to be 2.")
+
+            with Session(bind=engine) as session:
+                setting = session.execute(
+                    text("SELECT current_setting('rls.account_id', true)")
+                ).scalar()
+                self.assertFalse(setting, "Expected no context to be applied.")
+        finally:
+            engine.dispose()
+
+    @contextlib.contextmanager
+    def grant_insert_on_items(self):
+        """Lets the non superadmin user insert items, removed at the end."""
+        with self.admin_engine.begin() as connection:
+            connection.execute(
+                text(
+                    "GRANT INSERT ON items TO test_user; "
+                    "GRANT USAGE ON SEQUENCE items_id_seq TO test_user;"
+                )
+            )
+        try:
+            yield
+        finally:
+            with self.admin_engine.begin() as connection:
+                connection.execute(delete(models.Item).where(models.Item.id > 4))
+                connection.execute(text("REVOKE INSERT ON items FROM test_user"))
+
+    def count_items(self, title_prefix: str) -> int:
+        with self.admin_engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).where(models.Item.title.startswith(title_prefix))
+            ).scalar_one()
+
+    def test_rls_connection(self):
+        items = [{"title": f"Ingested item {i}", "owner_id": 1} for i in range(1, 101)]
+        context = models.SampleRlsContext(account_id=1)
+        with self.grant_insert_on_items():
+            with self.record_statements() as statements:
+                # executemany, batched by insertmanyvalues
+                with rls_connection(self.non_superadmin_engine, context) as connection:
+                    connection.execute(insert(models.Item), items)
+            self.assertEqual(
+                len([stmt for stmt in statements if "set_config" in stmt]),
+                1,
+                "Expected the context to be applied once.",
+            )
+
+            with self.assertRaises(exc.ProgrammingError):
+                with rls_connection(self.non_superadmin_engine, context) as connection:
+                    connection.execute(
+                        insert(models.Item), [{"title": "Other item", "owner_id": 2}]
+                    )
+
+            self.assertEqual(
+                self.count_items("Ingested"), 100, "Expected 100 items to be inserted."
+            )
+
+    def test_insert_by_tenant(self):
+        rows = [
+            {"title": f"Imported item {i}", "owner_id": i % 2 + 1} for i in range(100)
+        ]
+        with self.grant_insert_on_items():
+            with self.record_statements() as statements:
+                with self.non_superadmin_engine.begin() as connection:
+                    insert_by_tenant(
+                        connection,
+                        models.Item,
+                        rows,
+                        tenant_key=lambda row: row["owner_id"],
+                        context_factory=lambda owner_id: models.SampleRlsContext(
+                            account_id=owner_id
+                        ),
+                    )
+            self.assertEqual(
+                [stmt.split()[0] for stmt in statements],
+                ["SELECT", "INSERT", "SELECT", "INSERT"],
+                "Expected one context switch and one INSERT per tenant.",
+            )
+            self.assertEqual(self.count_items("Imported"), 100)
+
+            # The policies WITH CHECK clauses still apply
+            with self.assertRaises(exc.ProgrammingError):
+                with self.non_superadmin_engine.begin() as connection:
+                    insert_by_tenant(
+                        connection,
+                        models.Item,
+                        [{"title": "Other item", "owner_id": 2}],
+                        tenant_key=lambda row: 1,
+                        context_factory=lambda account_id: models.SampleRlsContext(
+                            account_id=account_id
+                        ),
+                    )
+
+    def test_tenant_affinity_pool(self):
+        engine = create_engine(
+            self.non_superadmin_engine.url,
+            poolclass=TenantAffinityPool,
+            pool_size=2,
+            max_overflow=0,
+        )
+        statements = []
+        event.listen(
+            engine,
+            "before_cursor_execute",
+            lambda conn, cursor, statement, *args: statements.append(statement),
+        )
+
+        class ExampleContextGetter(ContextGetter):
+            def get_context(self, *args, **kwargs) -> models.SampleRlsContext:
+                return models.SampleRlsContext(account_id=kwargs.get("account_id"))
+
+        my_sessioner = RlsSessioner(
+            sessionmaker=sessionmaker(class_=RlsSession, bind=engine),
+            context_getter=ExampleContextGetter(),
+        )
+
+        def get_user_ids(session):
+            res = session.execute(select(models.User.id)).scalars().all()
+            session.commit()
+            return res
+
+        # Prime a connection for each tenant
+        with my_sessioner(account_id=1) as first, my_sessioner(account_id=2) as second:
+            first.execute(select(models.User.id)).all()
+            second.execute(select(models.User.id)).all()
+            first.commit()
+            second.commit()
+
+        for account_id in (1, 2, 1):
+            statements.clear()
+            with my_sessioner(account_id=account_id) as session:
+                self.assertEqual(get_user_ids(session), [account_id])
+            self.assertFalse(
+                [stmt for stmt in statements if "set_config" in stmt],
+                "Expected the context not to be applied again.",
+            )
+
+        with my_sessioner(account_id=1) as session:
+            with session.bypass_rls():
+                res = session.execute(select(models.User.id)).scalars().all()
+                self.assertEqual(res, [1, 2], "Expected RLS to be bypassed.")
+            self.assertEqual(get_user_ids(session), [1])
+
+        statements.clear()
+        with my_sessioner(account_id=3) as session:
+            self.assertEqual(get_user_ids(session), [])
+        self.assertTrue([stmt for stmt in statements if "set_config" in stmt])
+
+        self.assertEqual(engine.pool.hits, 4)
+        self.assertEqual(engine.pool.misses, 3)
+        engine.dispose()
+
+    def test_tenant_affinity_pool_after_savepoint_rollback(self):
+        engine = create_engine(
+            self.non_superadmin_engine.url,
+            poolclass=TenantAffinityPool,
+            pool_size=1,
+            max_overflow=0,
+        )
+        with RlsSession(
+            context=models.SampleRlsContext(account_id=1), bind=engine
+        ) as session:
+            session.execute(select(models.User.id)).all()
+            savepoint = session.begin_nested()
+            session.set_context(models.SampleRlsContext(account_id=2))
+            session.execute(select(models.User.id)).all()
+            savepoint.rollback()
+            session.commit()
+
+        # The setting of the second tenant was rolled back with the savepoint
+        with RlsSession(
+            context=models.SampleRlsContext(account_id=2), bind=engine
+        ) as session:
+            res = session.execute(select(models.User.id)).scalars().all()
+            self.assertEqual(res, [2], "Expected the context to be applied.")
+        engine.dispose()
+
+    def test_stream_batches(self):
+        server_side = []
+
+        @event.listens_for(self.non_superadmin_engine, "before_cursor_execute")
+        def record_server_side(conn, cursor, statement, parameters, context, *args):
+            server_side.append(context._is_server_side)
+
+        with self.record_statements() as statements:
+            with RlsSession(
+                context=models.SampleRlsContext(account_id=1),
+                bind=self.non_superadmin_engine,
+            ) as session:
+                batches = session.stream_batches(
+                    select(models.Item.id).order_by(models.Item.id), batch_size=3
+                )
+                self.assertEqual(
+                    [[row.id for row in rows] for rows in batches],
+                    [[1, 2, 3], [4]],
+                    "Expected the items in batches of 3.",
+                )
+        self.assertEqual(
+            len([stmt for stmt in statements if "set_config" in stmt]),
+            1,
+            "Expected the context to be applied once.",
+        )
+        event.remove(
+            self.non_superadmin_engine, "before_cursor_execute", record_server_side
+        )
+        self.assertEqual(
+            server_side, [False, True], "Expected a server side cursor for the items."
+        )
+
+    def get_pooled_setting_after_session(self, context_mode, reset_on_checkin=False):
+        """Runs a session on a single connection pool and returns the
+        `rls.account_id` setting left on the connection afterwards."""
+        engine = create_engine(
+            self.non_superadmin_engine.url, pool_size=1, max_overflow=0
+        )
+        if reset_on_checkin:
+            reset_rls_settings_on_checkin(engine)
+        try:
+            with RlsSession(
+                context=models.SampleRlsContext(account_id=1),
+                bind=engine,
+                context_mode=context_mode,
+            ) as session:
+                res = session.execute(text("SELECT id FROM users")).scalars().all()
+                self.assertEqual(res, [1], "Expected 1 user to be returned.")
+                session.commit()
+
+            with engine.connect() as connection:
+                return connection.execute(
+                    text("SELECT current_setting('rls.account_id', true)")
+                ).scalar()
+        finally:
+            engine.dispose()
+
+    def test_transaction_local_context_mode(self):
+        setting = self.get_pooled_setting_after_session(ContextMode.set_config_local)
+        self.assertEqual(setting, "", "Expected no setting left on the connection.")
+
+    def test_reset_rls_settings_on_checkin(self):
+        setting = self.get_pooled_setting_after_session(ContextMode.set_config)
+        self.assertEqual(setting, "1", "Expected the session level setting to stay.")
+
+        setting = self.get_pooled_setting_after_session(
+            ContextMode.set_config, reset_on_checkin=True
+        )
+        self.assertEqual(setting, "", "Expected the setting to be reset on checkin.")
+
     def test_rls_query_with_rls_sessioner_and_bypass(self):
         # Concrete implementation of ContextGetter
         class ExampleContextGetter(ContextGetter):
@@ -152,6 +818,489 @@ class TestRLSPolicies(unittest.TestCase):
                 res = session.execute(text("SELECT * FROM users")).fetchall()
                 self.assertEqual(len(res), 2, "Expected 2 users to be returned.")
 
+    def test_rls_sessioner_routes_read_only_sessions_to_replicas(self):
+        class ExampleContextGetter(ContextGetter):
+            def get_context(self, *args, **kwargs) -> models.SampleRlsContext:
+                return models.SampleRlsContext(account_id=kwargs.get("account_id"))
+
+        replicas = [create_engine(self.non_superadmin_engine.url) for _ in range(2)]
+        my_sessioner = RlsSessioner(
+            sessionmaker=self.session_maker,
+            context_getter=ExampleContextGetter(),
+            replicas=replicas,
+        )
+
+        with my_sessioner(account_id=2) as session:
+            self.assertIs(session.bind, self.non_superadmin_engine)
+        for replica in replicas * 2:
+            with my_sessioner(account_id=2, read_only=True) as session:
+                self.assertIs(session.bind, replica, "Expected round robin.")
+                res = session.execute(select(models.User.id)).scalars()
+                self.assertEqual(list(res), [2], "Expected the context applied.")
+
+        my_sessioner.replica_strategy = ReplicaStrategy.least_connections
+        with replicas[0].connect():
+            with my_sessioner(account_id=2, read_only=True) as session:
+                self.assertIs(session.bind, replicas[1])
+        with replicas[1].connect():
+            with my_sessioner(account_id=2, read_only=True) as session:
+                self.assertIs(session.bind, replicas[0])
+
+        for replica in replicas:
+            replica.dispose()
+
+    def test_bypass_role(self):
+        with self.admin_engine.begin() as connection:
+            connection.execute(
+                text(
+                    "CREATE ROLE rls_bypass NOLOGIN;"
+                    "GRANT rls_bypass TO test_user WITH INHERIT FALSE"
+                )
+            )
+        models.RoleBypassBase.metadata.create_all(self.admin_engine)
+        with self.admin_engine.begin() as connection:
+            connection.execute(
+                insert(models.TenantRow),
+                [{"id": i, "owner_id": i % 3 + 1} for i in range(3000)],
+            )
+            connection.execute(
+                text(
+                    "ANALYZE tenant_rows;"
+                    "GRANT SELECT ON tenant_rows TO test_user, rls_bypass"
+                )
+            )
+
+        def explain(session, query) -> str:
+            session.execute(text("SET LOCAL enable_seqscan = off"))
+            plan = session.execute(text(f"EXPLAIN {query}")).scalars()
+            return "\n".join(plan)
+
+        context = models.SampleRlsContext(account_id=2)
+        for context_mode in (ContextMode.set_config, ContextMode.set):
+            with RlsSession(
+                context=context,
+                bind=self.non_superadmin_engine,
+                context_mode=context_mode,
+                bypass_role="rls_bypass",
+            ) as session:
+                count = select(func.count()).select_from(models.TenantRow)
+                self.assertEqual(session.execute(count).scalar(), 1000)
+                self.assertIn("Index", explain(session, "SELECT * FROM tenant_rows"))
+
+                with session.bypass_rls():
+                    # The restrictive policy is bypassed too
+                    self.assertEqual(session.execute(count).scalar(), 3000)
+                    plan = explain(
+                        session, "SELECT * FROM tenant_rows WHERE owner_id = 2"
+                    )
+                    self.assertIn("Index", plan)
+                    self.assertNotIn("CURRENT_USER", plan)
+                self.assertEqual(session.execute(count).scalar(), 1000)
+
+        # Postgres folds the unquoted role names to lowercase
+        with RlsSession(
+            context=context, bind=self.non_superadmin_engine, bypass_role="RLS_Bypass"
+        ) as session:
+            with session.bypass_rls():
+                self.assertEqual(session.execute(count).scalar(), 3000)
+        with self.assertRaises(ValueError):
+            RlsSession(context=context, bypass_role="rls_bypass; DROP TABLE users")
+
+        # The overhead is measured against runs bypassing RLS with the role
+        report = measure_policy_overhead(
+            self.non_superadmin_engine,
+            models.RoleBypassBase.metadata,
+            context,
+            ["SELECT * FROM tenant_rows"],
+            repeat=1,
+        )
+        [query] = report.queries
+        self.assertEqual(query.with_rls.actual_rows, 1000)
+        self.assertEqual(query.bypassed.actual_rows, 3000)
+
+        with self.admin_engine.connect() as connection:
+            migration_context = MigrationContext.configure(
+                connection,
+                opts={
+                    "include_name": lambda name, type_, parent_names: (
+                        type_ != "table" or name == "tenant_rows"
+                    )
+                },
+            )
+            metadata = models.RoleBypassBase.metadata
+            upgrade_ops = produce_migrations(migration_context, metadata).upgrade_ops
+            self.assertTrue(upgrade_ops.is_empty(), "Expected no policy changes.")
+            metadata.info["rls_bypass_role"] = "RLS_Bypass"
+            try:
+                upgrade_ops = produce_migrations(
+                    migration_context, metadata
+                ).upgrade_ops
+            finally:
+                metadata.info["rls_bypass_role"] = "rls_bypass"
+            self.assertTrue(upgrade_ops.is_empty(), "Expected no policy changes.")
+
+            connection.execute(
+                text("DROP POLICY tenant_rows_bypass_rls_policy ON tenant_rows")
+            )
+            upgrade_ops = produce_migrations(migration_context, metadata).upgrade_ops
+            [create_bypass_policy] = upgrade_ops.ops[0].ops
+            self.assertEqual(
+                create_bypass_policy.policy_name, "tenant_rows_bypass_rls_policy"
+            )
+            self.assertEqual(create_bypass_policy.roles, ["rls_bypass"])
+            connection.rollback()
+
+            # Changing the roles of a policy recreates it
+            [policy, _] = metadata.info["rls_policies"]["tenant_rows"]
+            policy.roles = ["test_user"]
+            try:
+                upgrade_ops = produce_migrations(
+                    migration_context, metadata
+                ).upgrade_ops
+            finally:
+                policy.roles = None
+            drop_policy, create_policy = upgrade_ops.ops[0].ops
+            self.assertIsInstance(drop_policy, DropPolicyOp)
+            self.assertEqual(drop_policy.roles, ["public"])
+            self.assertEqual(create_policy.roles, ["test_user"])
+            # The expression read from the database already has its bypass check
+            self.assertFalse(drop_policy.reverse().add_bypass)
+            self.assertTrue(create_policy.add_bypass)
+
+        # An expression mentioning CURRENT_USER still gets the bypass check
+        sql = generate_rls_policy(
+            cmd="SELECT",
+            definition="RESTRICTIVE",
+            policy_name="owner",
+            table_name="tenant_rows",
+            expr="owner_name = CURRENT_USER",
+            bypass_role="rls_bypass",
+        )
+        self.assertIn("CURRENT_USER = 'rls_bypass'", str(sql))
+
+    def test_accessor_functions(self):
+        models.AccessorFunctionsBase.metadata.create_all(self.admin_engine)
+        with self.admin_engine.begin() as connection:
+            connection.execute(
+                insert(models.Document),
+                [{"id": i, "owner_id": i % 2 + 1} for i in range(10)],
+            )
+            connection.execute(text("GRANT SELECT ON documents TO test_user"))
+            qual = connection.execute(
+                text("SELECT qual FROM pg_policies WHERE tablename = 'documents'")
+            ).scalar()
+            function = connection.execute(
+                text(
+                    "SELECT provolatile, proparallel FROM pg_proc "
+                    "WHERE proname = 'account_id'"
+                )
+            ).one()
+        self.assertIn("rls.account_id()", qual)
+        self.assertNotIn("current_setting('rls.account_id'", qual)
+        self.assertEqual(tuple(function), ("s", "s"), "Expected STABLE PARALLEL SAFE.")
+
+        context = models.SampleRlsContext(account_id=2)
+        with RlsSession(context=context, bind=self.non_superadmin_engine) as session:
+            res = session.execute(select(models.Document.owner_id)).scalars()
+            self.assertEqual(set(res), {2})
+
+        with self.admin_engine.connect() as connection:
+            migration_context = MigrationContext.configure(
+                connection,
+                opts={
+                    "include_name": lambda name, type_, parent_names: (
+                        type_ != "table" or name == "documents"
+                    )
+                },
+            )
+            metadata = models.AccessorFunctionsBase.metadata
+            upgrade_ops = produce_migrations(migration_context, metadata).upgrade_ops
+            self.assertTrue(upgrade_ops.is_empty(), "Expected no changes.")
+
+            # `target_metadata` may be a list
+            upgrade_ops = produce_migrations(migration_context, [metadata]).upgrade_ops
+            self.assertTrue(upgrade_ops.is_empty(), "Expected no changes.")
+
+            connection.execute(
+                text(
+                    "CREATE OR REPLACE FUNCTION rls.account_id() RETURNS INTEGER "
+                    "LANGUAGE sql STABLE AS $$SELECT 1$$"
+                )
+            )
+            upgrade_ops = produce_migrations(migration_context, metadata).upgrade_ops
+            [create_function] = upgrade_ops.ops
+            self.assertIsInstance(create_function, CreateAccessorFunctionOp)
+            self.assertEqual(
+                (create_function.name, create_function.type_),
+                ("account_id", "INTEGER"),
+            )
+            connection.rollback()
+
+            # The policies using a function are dropped while its type changes
+            functions = metadata.info["rls_accessor_functions"]
+            metadata.info["rls_accessor_functions"] = {"account_id": "BIGINT"}
+            try:
+                upgrade_ops = produce_migrations(
+                    migration_context, metadata
+                ).upgrade_ops
+            finally:
+                metadata.info["rls_accessor_functions"] = functions
+            self.assertEqual(
+                [type(op_) for op_ in upgrade_ops.ops],
+                [
+                    DropPolicyOp,
+                    DropAccessorFunctionOp,
+                    CreateAccessorFunctionOp,
+                    CreatePolicyOp,
+                ],
+            )
+            self.assertEqual(
+                {upgrade_ops.ops[0].policy_name, upgrade_ops.ops[3].policy_name},
+                {"documents_owner_all_policy_0"},
+            )
+            operations = Operations(migration_context)
+            for op_ in upgrade_ops.ops:
+                operations.invoke(op_)
+            function_type = connection.execute(
+                text(
+                    "SELECT CAST(CAST(prorettype AS regtype) AS text) FROM pg_proc "
+                    "WHERE proname = 'account_id'"
+                )
+            ).scalar()
+            self.assertEqual(function_type, "bigint")
+            connection.rollback()
+
+    def test_index_advisor(self):
+        with self.admin_engine.connect() as connection:
+            missing_indexes = find_missing_policy_indexes(connection, models.Base)
+        # `users.id` is the primary key, `items.owner_id` is not indexed
+        self.assertEqual(
+            missing_indexes,
+            [
+                MissingIndex(
+                    "items",
+                    "owner_id",
+                    "items_equal_to_accountid_policy_select_policy_0",
+                )
+            ],
+        )
+
+        with self.admin_engine.connect() as connection:
+            migration_context = MigrationContext.configure(
+                connection,
+                opts={
+                    "include_object": include_policy_indexes(
+                        models.Base.metadata,
+                        lambda object_, name, type_, *args: (
+                            type_ != "table" or name == "items"
+                        ),
+                    ),
+                    "rls_create_policy_indexes": True,
+                },
+            )
+            upgrade_ops = produce_migrations(
+                migration_context, models.Base.metadata
+            ).upgrade_ops
+            [create_index] = upgrade_ops.ops[0].ops
+            self.assertIsInstance(create_index, CreateIndexOp)
+            self.assertEqual(create_index.index_name, "ix_items_owner_id")
+            self.assertEqual(create_index.table_name, "items")
+
+            # The created index is neither dropped nor created again
+            Operations(migration_context).invoke(create_index)
+            upgrade_ops = produce_migrations(
+                migration_context, models.Base.metadata
+            ).upgrade_ops
+            self.assertTrue(upgrade_ops.is_empty(), "Expected no changes.")
+            connection.rollback()
+
+    def test_autogenerate_reads_the_catalog_once(self):
+        statements = []
+
+        def count_statements(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.admin_engine.connect() as connection:
+            event.listen(connection, "before_cursor_execute", count_statements)
+            migration_context = MigrationContext.configure(
+                connection,
+                opts={
+                    "include_object": lambda object_, name, type_, *args: (
+                        type_ != "table" or name in ("users", "items")
+                    ),
+                    "rls_create_policy_indexes": True,
+                },
+            )
+            autogen_context = AutogenContext(migration_context, models.Base.metadata)
+            catalog = get_rls_catalog(autogen_context)
+            self.assertIs(get_rls_catalog(autogen_context), catalog)
+            self.assertTrue(catalog[("public", "items")].rls_enabled)
+            self.assertTrue(catalog[("public", "items")].rls_forced)
+            self.assertIn("id", catalog[("public", "items")].indexed_columns)
+            self.assertEqual(
+                len(catalog[("public", "items")].get_policies()),
+                len(check_rls_policies(connection, None, "items")),
+            )
+
+            statements.clear()
+            produce_migrations(migration_context, models.Base.metadata)
+            # The tables, their RLS flags and their policies come from one query
+            catalog_statements = [
+                s
+                for s in statements
+                if any(
+                    name in s
+                    for name in (
+                        "pg_policies",
+                        "relrowsecurity",
+                        "information_schema.tables",
+                    )
+                )
+            ]
+            self.assertEqual(len(catalog_statements), 1, statements)
+
+    def test_measure_policy_overhead(self):
+        report = measure_policy_overhead(
+            self.non_superadmin_engine,
+            models.Base.metadata,
+            models.SampleRlsContext(account_id=1),
+            ["SELECT * FROM items", select(models.User.username)],
+            repeat=1,
+        )
+        self.assertEqual(
+            [query.query for query in report.queries],
+            ["SELECT * FROM items", "SELECT users.username \nFROM users"],
+        )
+        for query in report.queries:
+            self.assertIn("Seq Scan", query.with_rls.plan_shape)
+            self.assertGreaterEqual(query.with_rls.execution_time, 0)
+
+        # Policies on updates only are left out
+        self.assertCountEqual(
+            [(policy.table_name, policy.policy_name) for policy in report.policies],
+            [
+                ("users", "users_equal_to_accountid_policy_select_policy_0"),
+                ("items", "items_equal_to_accountid_policy_select_policy_0"),
+                ("items", "items_greater_than_accountid_policy_select_policy_1"),
+                ("items", "items_smaller_than_or_equal_accountid_policy_all_policy_2"),
+            ],
+        )
+        self.assertEqual(report.policies[0].baseline.plan_shape[0], "Aggregate")
+        # The report round trips through json
+        self.assertEqual(
+            OverheadReport.model_validate_json(report.model_dump_json()), report
+        )
+
+    def test_consolidated_policies(self):
+        models.ConsolidatedBase.metadata.create_all(self.admin_engine)
+        with self.admin_engine.begin() as connection:
+            connection.execute(
+                insert(models.Note),
+                [
+                    {"id": 1, "owner_id": 1, "reviewer_id": 2},
+                    {"id": 2, "owner_id": 2, "reviewer_id": 1},
+                    {"id": 3, "owner_id": 3, "reviewer_id": 3},
+                    {"id": 4, "owner_id": 4, "reviewer_id": 4},
+                ],
+            )
+            connection.execute(text("GRANT SELECT ON notes TO test_user"))
+            policies = connection.execute(
+                text(
+                    "SELECT policyname, cmd FROM pg_policies "
+                    "WHERE tablename = 'notes' ORDER BY policyname"
+                )
+            ).all()
+        # 7 policies without consolidation
+        self.assertEqual(
+            [tuple(policy) for policy in policies],
+            [
+                ("notes_consolidated_all_policy", "ALL"),
+                ("notes_consolidated_select_policy", "SELECT"),
+                ("notes_reviewer_update_policy_1", "UPDATE"),
+            ],
+        )
+
+        context = models.SampleRlsContext(account_id=1)
+        with RlsSession(context=context, bind=self.non_superadmin_engine) as session:
+            res = session.execute(select(models.Note.id).order_by(models.Note.id))
+            self.assertEqual(list(res.scalars()), [1, 2])
+        context = models.SampleRlsContext(account_id=4)
+        with RlsSession(context=context, bind=self.non_superadmin_engine) as session:
+            res = session.execute(select(models.Note.id).order_by(models.Note.id))
+            self.assertEqual(list(res.scalars()), [4])
+
+        # The overhead is reported for the policies as the database has them
+        report = measure_policy_overhead(
+            self.non_superadmin_engine,
+            models.ConsolidatedBase.metadata,
+            context,
+            [],
+            repeat=1,
+        )
+        self.assertCountEqual(
+            [policy.policy_name for policy in report.policies],
+            ["notes_consolidated_all_policy", "notes_consolidated_select_policy"],
+        )
+
+        with self.admin_engine.connect() as connection:
+            migration_context = MigrationContext.configure(
+                connection,
+                opts={
+                    "include_name": lambda name, type_, parent_names: (
+                        type_ != "table" or name == "notes"
+                    )
+                },
+            )
+            metadata = models.ConsolidatedBase.metadata
+            upgrade_ops = produce_migrations(migration_context, metadata).upgrade_ops
+            self.assertTrue(upgrade_ops.is_empty(), "Expected no policy changes.")
+
+    def test_array_condition_args(self):
+        models.MembershipBase.metadata.create_all(self.admin_engine)
+        with self.admin_engine.begin() as connection:
+            connection.execute(
+                insert(models.Project),
+                [{"id": i, "account_id": i % 10} for i in range(1000)],
+            )
+            connection.execute(
+                text("ANALYZE projects; GRANT SELECT ON projects TO test_user")
+            )
+            qual = connection.execute(
+                text("SELECT qual FROM pg_policies WHERE tablename = 'projects'")
+            ).scalar()
+        self.assertIn("account_id = ANY", qual)
+
+        query = select(models.Project.account_id).distinct()
+        for context_mode in ContextMode:
+            for account_ids in ([], [3], [1, 2]):
+                context = models.MembershipRlsContext(account_ids=account_ids)
+                with RlsSession(
+                    context=context,
+                    bind=self.non_superadmin_engine,
+                    context_mode=context_mode,
+                ) as session:
+                    res = session.execute(query).scalars()
+                    self.assertEqual(set(res), set(account_ids))
+
+        context = models.MembershipRlsContext(account_ids=[1, 2])
+        with RlsSession(context=context, bind=self.non_superadmin_engine) as session:
+            plan = session.execute(text("EXPLAIN SELECT * FROM projects")).scalars()
+            # The array is parsed once, by an InitPlan, instead of once per row
+            self.assertNotIn("current_setting", "\n".join(plan))
+
+        with self.admin_engine.connect() as connection:
+            migration_context = MigrationContext.configure(
+                connection,
+                opts={
+                    "include_name": lambda name, type_, parent_names: (
+                        type_ != "table" or name == "projects"
+                    )
+                },
+            )
+            metadata = models.MembershipBase.metadata
+            upgrade_ops = produce_migrations(migration_context, metadata).upgrade_ops
+            self.assertTrue(upgrade_ops.is_empty(), "Expected no policy changes.")
+
 
 if __name__ == "__main__":
     unittest.main()